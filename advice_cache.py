@@ -0,0 +1,194 @@
+# advice_cache.py - AI建议持久化缓存（SQLite）与同键请求合并
+#
+# 提示词只取决于少量档案字段、风险类型和资产配置，很多客户的提示词实际上相同。
+# 这里按规范化后的提示词输入 + 模型名 + temperature 生成指纹，缓存解析后的建议；
+# 同一指纹的并发请求只发起一次模型调用，其余请求等待其结果（single-flight）。
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def parse_buckets(spec):
+    """解析分桶配置，例如 "income=10000,assets=50000"；空字符串或 None 表示不分桶"""
+    buckets = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, width = item.partition("=")
+        try:
+            width = int(width)
+        except ValueError:
+            width = 0
+        if not name.strip() or width <= 0:
+            raise ValueError(f"无效的分桶配置: {item}（格式为 字段=正整数）")
+        buckets[name.strip()] = width
+    return buckets
+
+
+def _cancel_requested():
+    """当前任务自身是否正被取消（Task.cancelling 为 Python 3.11 新增，更早的版本视为否）"""
+    cancelling = getattr(asyncio.current_task(), "cancelling", None)
+    return bool(cancelling and cancelling())
+
+
+class AdviceCache:
+    """InvestmentAdviceParser 解析结果的持久化缓存
+
+    buckets 可把数值字段按区间归并，例如 {"income": 10000, "assets": 50000}
+    表示年收入按 1 万、资产按 5 万取整后再计算指纹。提示词中含有精确的收入和资产，
+    分桶后同一桶的客户可能看到引用其他客户数字的建议，所以默认不分桶。
+    max_age 为缓存有效秒数，None 表示永不过期。
+    """
+
+    def __init__(self, path="advice_cache.sqlite3", buckets=None, max_age=None):
+        self.path = path
+        self.buckets = dict(buckets or {})
+        self.max_age = max_age
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS advice ("
+            " key TEXT PRIMARY KEY, model TEXT, temperature REAL, parsed TEXT, created_at REAL)"
+        )
+        self._db_lock = threading.Lock()
+        self._inflight_lock = threading.Lock()
+        self._inflight = {}
+        self._async_inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _normalize(self, name, value):
+        """数字字符串转为整数并按配置分桶，其余值去掉首尾空白"""
+        if isinstance(value, str):
+            value = value.strip()
+            try:
+                value = int(value)
+            except ValueError:
+                return value
+        if isinstance(value, (int, float)) and name in self.buckets:
+            value = int(value // self.buckets[name] * self.buckets[name])
+        return value
+
+    def fingerprint(self, fields, model, temperature):
+        """由提示词输入字段、模型名和 temperature 生成缓存键"""
+        normalized = {name: self._normalize(name, value) for name, value in fields.items()}
+        canonical = json.dumps([normalized, model, temperature], sort_keys=True, ensure_ascii=False,
+                               separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self._db_lock:
+            row = self._conn.execute("SELECT parsed, created_at FROM advice WHERE key = ?", (key,)).fetchone()
+        if row is None or (self.max_age is not None and time.time() - row[1] > self.max_age):
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, parsed, model, temperature):
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO advice (key, model, temperature, parsed, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, model, temperature, json.dumps(parsed, ensure_ascii=False), time.time()),
+            )
+
+    def get_or_compute(self, key, compute, model, temperature):
+        """同步版本：命中直接返回；未命中时同一 key 只有一个线程调用 compute()"""
+        parsed = self.get(key)
+        if parsed is not None:
+            self.hits += 1
+            return parsed
+
+        with self._inflight_lock:
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = self._inflight[key] = {"event": threading.Event()}
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            self.coalesced += 1
+            waiter["event"].wait()
+            if "error" in waiter:
+                raise waiter["error"]
+            return waiter["result"]
+
+        try:
+            # 成为 leader 前可能刚有其他线程写入，再查一次
+            parsed = self.get(key)
+            if parsed is not None:
+                self.hits += 1
+                waiter["result"] = parsed
+                return parsed
+            self.misses += 1
+            parsed = compute()
+            self.put(key, parsed, model, temperature)
+            waiter["result"] = parsed
+            return parsed
+        except Exception as e:
+            # 失败结果不缓存，只传给正在等待的请求
+            waiter["error"] = e
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+            waiter["event"].set()
+
+    async def aget_or_compute(self, key, compute, model, temperature):
+        """异步版本：compute 为返回协程的函数，同一事件循环内同 key 的请求共享一次调用
+
+        SQLite 读写在线程池中执行，不阻塞事件循环。发起调用的请求被取消（客户端断开、超时）时，
+        等待同一结果的其他请求不随之取消，而是重新查缓存并在需要时自己发起调用。
+        """
+        while True:
+            parsed = await asyncio.to_thread(self.get, key)
+            if parsed is not None:
+                self.hits += 1
+                return parsed
+
+            future = self._async_inflight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 只有发起调用的请求被取消而本请求没有被取消时才重试
+                if not future.cancelled() or _cancel_requested():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._async_inflight[key] = future
+        try:
+            # 查缓存期间可能刚有其他请求写入，再查一次
+            parsed = await asyncio.to_thread(self.get, key)
+            if parsed is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                parsed = await compute()
+                await asyncio.to_thread(self.put, key, parsed, model, temperature)
+            future.set_result(parsed)
+            return parsed
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            del self._async_inflight[key]
+
+    def stats(self):
+        with self._db_lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM advice").fetchone()[0]
+        return {"size": size, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,137 @@
+# advice_stream.py - AI建议的提示词构造与流式输出
+#
+# 命令行版和 Web 版共用：
+#   - build_advice_prompt: 构造AI建议提示词
+#   - ThinkTagFilter: 增量过滤 deepseek-r1 的 <think>...</think> 推理内容
+#   - stream_ollama_generate: 以 NDJSON 流式调用 Ollama /api/generate（仅用标准库）
+import json
+import urllib.request
+
+
+def build_advice_prompt(profile, allocation, risk_type, retirement_data):
+    """构造AI建议的提示词
+
+    profile 需包含 age、income、assets，可选 expenses、retirement_age。
+    """
+    return f"""
+用户档案：
+- 年龄: {profile['age']}岁
+- 年收入: {profile['income']}元
+- 现有资产: {profile['assets']}元
+- 月支出: {profile.get('expenses', '未知')}元
+- 计划退休年龄: {profile.get('retirement_age', 60)}岁
+- 风险偏好: {risk_type}
+
+养老需求分析：
+- 距离退休: {retirement_data['years_to_retire']}年
+- 预计所需养老资金: {retirement_data['total_retirement_needed']:,}元
+- 建议每月储蓄: {retirement_data['monthly_savings_needed']:,}元
+
+投资配置：
+{allocation}
+
+请用专业但易懂的中文给出：
+1. 对这个配置的简要评价
+2. 针对该用户的2-3条具体建议
+3. 重要的风险提示
+
+请保持回答简洁明了，不超过200字。
+"""
+
+
+class ThinkTagFilter:
+    """增量过滤 <think>...</think> 块
+
+    标签可能被拆在多个 token 里，因此末尾可能是标签前缀的部分会暂存到下一次 feed。
+    可见内容开头的空白（推理块后面通常跟着空行）也一并去掉。
+    """
+
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+        self._started = False
+
+    @staticmethod
+    def _partial_tag_length(text, tag):
+        """text 末尾与 tag 开头重合的最长长度"""
+        for length in range(min(len(text), len(tag) - 1), 0, -1):
+            if text.endswith(tag[:length]):
+                return length
+        return 0
+
+    def _visible(self, text):
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, chunk):
+        """输入一段模型输出，返回可以立即显示的文本"""
+        self._buffer += chunk
+        visible = []
+        while True:
+            tag = self.CLOSE_TAG if self._inside else self.OPEN_TAG
+            index = self._buffer.find(tag)
+            if index >= 0:
+                if not self._inside:
+                    visible.append(self._buffer[:index])
+                self._buffer = self._buffer[index + len(tag):]
+                self._inside = not self._inside
+                continue
+            keep = self._partial_tag_length(self._buffer, tag)
+            if not self._inside:
+                visible.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return self._visible("".join(visible))
+
+    def flush(self):
+        """输出结束时取出剩余的可见文本（未闭合的推理块直接丢弃）"""
+        remaining = "" if self._inside else self._buffer
+        self._buffer = ""
+        return self._visible(remaining)
+
+
+def filter_think_stream(chunks):
+    """把模型输出的 token 流转换为去掉推理块后的可见文本流"""
+    think_filter = ThinkTagFilter()
+    for chunk in chunks:
+        text = think_filter.feed(chunk)
+        if text:
+            yield text
+    text = think_filter.flush()
+    if text:
+        yield text
+
+
+def strip_think(text):
+    """一次性去掉完整文本中的推理块"""
+    return "".join(filter_think_stream([text]))
+
+
+def stream_ollama_generate(base_url, model, prompt, temperature=0.3, timeout=120):
+    """流式调用 Ollama，逐个产出原始 token（含推理块）"""
+    payload = json.dumps({
+        "model": model,
+        "prompt": prompt,
+        "stream": True,
+        "options": {"temperature": temperature},
+    }).encode("utf-8")
+    request = urllib.request.Request(
+        base_url.rstrip("/") + "/api/generate", data=payload,
+        headers={"Content-Type": "application/json"}, method="POST"
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        for line in response:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if message.get("error"):
+                raise RuntimeError(message["error"])
+            if message.get("response"):
+                yield message["response"]
+            if message.get("done"):
+                break
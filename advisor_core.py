@@ -1,23 +1,612 @@
 # advisor_core.py - 养老规划核心逻辑
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
+import os
+import threading
+import time
+from types import MappingProxyType
+
+import numpy as np
+
+from advice_stream import build_advice_prompt, filter_think_stream, stream_ollama_generate
+from product_catalog import ProductCatalog
+
+# 规则与假设版本号：修改配置规则、收益/通胀假设时递增，缓存和增量规划据此失效
+ASSUMPTIONS_VERSION = "1"
+
+# 资产类别顺序（批量计算时配置矩阵的列顺序）
+ASSET_CLASSES = ("股票", "债券", "现金", "另类投资")
+RISK_TYPES = ("保守型", "稳健型", "进取型")
+
+# ---------- 资产配置规则表 ----------
+# 配置只取决于 风险类型、年龄段（<35, <50, >=50）和 资产是否超过 50 万，
+# 规则在此声明，导入时编译成不可变的查找索引，请求路径上只做一次字典查找。
+AGE_BAND_LIMITS = (35, 50)
+WEALTHY_ASSETS_THRESHOLD = 500000
+
+# 风险类型 -> 各年龄段的基础配置百分比，列顺序见 ASSET_CLASSES
+ALLOCATION_RULES = {
+    "保守型": ((20, 50, 25, 5), (15, 55, 25, 5), (10, 60, 25, 5)),
+    "稳健型": ((50, 35, 10, 5), (40, 40, 15, 5), (30, 45, 20, 5)),
+    "进取型": ((70, 20, 5, 5), (60, 25, 10, 5), (50, 30, 15, 5)),
+}
+# 资产较多时增加分散化: 另类投资 +5，股票 -3，债券 -2
+WEALTHY_ADJUSTMENT = (-3, -2, 0, 5)
+
+
+class FrozenAllocation(dict):
+    """只读的配置字典（dict 子类，可直接 JSON 序列化，可跨进程传递）"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("资产配置是共享的只读对象，请先 dict(allocation) 复制再修改")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __reduce__(self):
+        return (FrozenAllocation, (dict(self),))
+
+
+def _compile_allocation_index():
+    """把规则表编译成 {(风险类型, 年龄段, 是否高资产): 只读配置} 索引"""
+    index = {}
+    for risk_type, bands in ALLOCATION_RULES.items():
+        for band, base in enumerate(bands):
+            for wealthy in (False, True):
+                percentages = base
+                if wealthy:
+                    percentages = tuple(p + d for p, d in zip(base, WEALTHY_ADJUSTMENT))
+                index[(risk_type, band, wealthy)] = FrozenAllocation(zip(ASSET_CLASSES, percentages))
+    return MappingProxyType(index)
+
+
+ALLOCATION_INDEX = _compile_allocation_index()
+
+# 批量计算使用的同一份规则: [风险类型下标, 年龄段, 是否高资产] -> 百分比向量
+_BATCH_ALLOCATION_TABLE = np.array([
+    [[list(ALLOCATION_INDEX[(risk_type, band, wealthy)].values()) for wealthy in (False, True)]
+     for band in range(len(AGE_BAND_LIMITS) + 1)]
+    for risk_type in RISK_TYPES
+], dtype=np.int64)
+_BATCH_ALLOCATION_TABLE.setflags(write=False)
+
+
+def age_band(age):
+    """年龄段下标: 0 为 <35 岁，1 为 <50 岁，2 为 50 岁及以上"""
+    if age < AGE_BAND_LIMITS[0]:
+        return 0
+    if age < AGE_BAND_LIMITS[1]:
+        return 1
+    return 2
+
+
+def lookup_allocation(risk_type, age, assets):
+    """查表得到资产配置（返回共享的只读字典）"""
+    return ALLOCATION_INDEX[(risk_type, age_band(age), assets > WEALTHY_ASSETS_THRESHOLD)]
+
+
+# ---------- 下滑路径（glide path） ----------
+# 查表配置在年龄段边界处跳变；下滑路径在每个边界前 GLIDEPATH_TRANSITION_YEARS 年内逐年线性过渡，
+# 到边界年龄时正好等于下一年龄段的配置，其余年龄与查表配置相同。
+# 启动时为每个 风险类型 × 资产档位（是否高资产）预先算好 GLIDEPATH_MIN_AGE..GLIDEPATH_MAX_AGE
+# 每个年龄的配置，表外的年龄配置不再变化，按最近的年龄取值即可。
+GLIDEPATH_TRANSITION_YEARS = 10
+GLIDEPATH_MIN_AGE = 18
+GLIDEPATH_MAX_AGE = 100
+
+
+def _compile_glidepath_table():
+    """[风险类型下标, 是否高资产, 年龄 - GLIDEPATH_MIN_AGE] -> 百分比向量（float64，只读）"""
+    anchor_ages = []
+    for limit in AGE_BAND_LIMITS:
+        anchor_ages += [limit - GLIDEPATH_TRANSITION_YEARS, limit]
+    if any(b <= a for a, b in zip(anchor_ages, anchor_ages[1:])):
+        raise ValueError("GLIDEPATH_TRANSITION_YEARS 不能超过年龄段宽度")
+    # 每个过渡期从上一年龄段的配置开始，到下一年龄段的配置结束
+    anchor_bands = [band for band in range(len(AGE_BAND_LIMITS)) for band in (band, band + 1)]
+
+    ages = np.arange(GLIDEPATH_MIN_AGE, GLIDEPATH_MAX_AGE + 1)
+    table = np.empty((len(RISK_TYPES), 2, len(ages), len(ASSET_CLASSES)))
+    for r in range(len(RISK_TYPES)):
+        for wealthy in (0, 1):
+            anchors = _BATCH_ALLOCATION_TABLE[r, anchor_bands, wealthy]
+            for c in range(len(ASSET_CLASSES)):
+                table[r, wealthy, :, c] = np.interp(ages, anchor_ages, anchors[:, c])
+    table.setflags(write=False)
+    return table
+
+
+GLIDEPATH_TABLE = _compile_glidepath_table()
+_GLIDEPATH_TABLE_FLAT = GLIDEPATH_TABLE.reshape(-1, len(ASSET_CLASSES)).astype(np.float32)
+_GLIDEPATH_TABLE_FLAT.setflags(write=False)
+
+
+def glidepath_rows(ages):
+    """年龄（标量或数组）在 GLIDEPATH_TABLE 中的行下标"""
+    return np.clip(np.asarray(ages, dtype=np.int64), GLIDEPATH_MIN_AGE, GLIDEPATH_MAX_AGE) - GLIDEPATH_MIN_AGE
+
+
+BATCH_REQUIRED_FIELDS = ('age', 'annual_income', 'current_assets', 'monthly_expenses', 'retirement_age')
+
+
+class PlanInputError(ValueError):
+    """规划请求数据校验失败"""
+
+
+def validate_plan_input(user_data):
+    """验证用户数据（Web、流式接口和离线批处理共用），返回规范化后的完整用户数据"""
+    if not isinstance(user_data, dict):
+        raise PlanInputError("请求数据必须是 JSON 对象")
+    
+    # 验证必需字段
+    for field in BATCH_REQUIRED_FIELDS:
+        if field not in user_data:
+            raise PlanInputError(f"缺少必需字段: {field}")
+    
+    # 验证数字字段
+    try:
+        age = int(user_data['age'])
+        annual_income = int(user_data['annual_income'])
+        current_assets = int(user_data['current_assets'])
+        monthly_expenses = int(user_data['monthly_expenses'])
+        retirement_age = int(user_data['retirement_age'])
+    except (TypeError, ValueError):
+        raise PlanInputError("请输入有效的数字")
+    
+    if retirement_age <= age:
+        raise PlanInputError("退休年龄必须大于当前年龄")
+    
+    return {
+        'age': age,
+        'annual_income': annual_income,
+        'current_assets': current_assets,
+        'monthly_expenses': monthly_expenses,
+        'retirement_age': retirement_age,
+        'risk_q1': user_data.get('risk_q1', 'B'),
+        'risk_q2': user_data.get('risk_q2', 'B'),
+        'risk_q3': user_data.get('risk_q3', 'B')
+    }
+
+# ---------- 客户档案表示 ----------
+# 风险问卷答案对应的得分，其他答案记 0 分
+RISK_ANSWER_POINTS = {'A': 1, 'B': 2, 'C': 3}
+
+
+def _int_column(columns, field, default, n, invalid=None):
+    """取出一列并转换为 int64 数组，缺失时使用默认值
+
+    给出 invalid（长度为 n 的布尔数组）时，无法转换为整数的值记为 0 并在 invalid 中标记，否则抛出 ValueError。
+    """
+    if field not in columns:
+        return np.full(n, default, dtype=np.int64)
+    column = np.asarray(columns[field])
+    if column.shape != (n,):
+        raise ValueError(f"字段 {field} 的长度与其他字段不一致")
+    if column.dtype.kind not in 'iu':
+        if invalid is None:
+            column = np.array([int(v) for v in column.tolist()], dtype=np.int64)
+        else:
+            values = np.zeros(n, dtype=np.int64)
+            for i, value in enumerate(column.tolist()):
+                try:
+                    values[i] = int(value)
+                except (TypeError, ValueError, OverflowError):
+                    invalid[i] = True
+            column = values
+    return column.astype(np.int64, copy=False)
+
+
+def _risk_points_column(columns, field, n):
+    """把一列风险问卷答案转换为得分（int8），缺失时按默认答案 B 计分"""
+    if field not in columns:
+        return np.full(n, RISK_ANSWER_POINTS['B'], dtype=np.int8)
+    answers = np.asarray(columns[field])
+    if answers.shape != (n,):
+        raise ValueError(f"字段 {field} 的长度与其他字段不一致")
+    # 与 ClientProfile.from_mapping 一致: 答案为 None（JSON null）时按默认答案 B 计分
+    if answers.dtype == object:
+        answers = np.where(np.equal(answers, None), 'B', answers)
+    # 答案种类很少，先去重再逐个计分
+    distinct, inverse = np.unique(answers.astype(str), return_inverse=True)
+    points = np.array([RISK_ANSWER_POINTS.get(answer.upper(), 0) for answer in distinct.tolist()], dtype=np.int8)
+    return points[inverse.reshape(n)]
+
+
+def _mix64(values):
+    """splitmix64 终混函数（uint64 数组，溢出按 2^64 取模）"""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+# 内容哈希的初始值由假设版本号决定，规则或假设变化后所有客户的哈希都会改变
+_FINGERPRINT_SEED = np.uint64(int.from_bytes(hashlib.sha256(ASSUMPTIONS_VERSION.encode()).digest()[:8], 'little'))
+
+
+class ClientProfile:
+    """单个客户的已解析档案
+
+    构造时把数值字段转换为整数、风险答案转换为大写，之后各方法直接读取属性，
+    不再重复解析。同时支持 profile['age'] 和 profile.get('age') 的字典式读取。
+    """
+
+    __slots__ = ('age', 'annual_income', 'current_assets', 'monthly_expenses', 'retirement_age',
+                 'risk_q1', 'risk_q2', 'risk_q3', 'annual_contribution')
+
+    def __init__(self, age=30, annual_income=0, current_assets=0, monthly_expenses=5000, retirement_age=60,
+                 risk_q1='B', risk_q2='B', risk_q3='B', annual_contribution=None):
+        self.age = int(age)
+        self.annual_income = int(annual_income)
+        self.current_assets = int(current_assets)
+        self.monthly_expenses = int(monthly_expenses)
+        self.retirement_age = int(retirement_age)
+        self.risk_q1 = str(risk_q1).upper()
+        self.risk_q2 = str(risk_q2).upper()
+        self.risk_q3 = str(risk_q3).upper()
+        self.annual_contribution = None if annual_contribution is None else float(annual_contribution)
+
+    @classmethod
+    def from_mapping(cls, user_data):
+        """由 user_data 字典构造（缺失字段使用默认值）；已经是 ClientProfile 时原样返回"""
+        if isinstance(user_data, cls):
+            return user_data
+        return cls(**{field: user_data[field] for field in cls.__slots__ if user_data.get(field) is not None})
+
+    @property
+    def risk_points(self):
+        """三道风险问卷的总得分"""
+        return sum(RISK_ANSWER_POINTS.get(answer, 0) for answer in (self.risk_q1, self.risk_q2, self.risk_q3))
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field, default=None):
+        value = getattr(self, field, None) if field in self.__slots__ else None
+        return default if value is None else value
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    def __repr__(self):
+        return f"ClientProfile({', '.join(f'{k}={v!r}' for k, v in self.to_dict().items())})"
+
+
+class ClientBook:
+    """列式客户档案：每个字段一个 int64 NumPy 数组，批量方法直接按列计算
+
+    risk_points 为 (n, 3) 的 int8 矩阵，保存三道风险问卷各自的得分。
+    """
+
+    __slots__ = ('age', 'annual_income', 'current_assets', 'monthly_expenses', 'retirement_age', 'risk_points')
+
+    def __init__(self, age, annual_income, current_assets, monthly_expenses, retirement_age, risk_points=None):
+        self.age = np.asarray(age, dtype=np.int64)
+        n = len(self.age)
+        for field, values in (('annual_income', annual_income), ('current_assets', current_assets),
+                              ('monthly_expenses', monthly_expenses), ('retirement_age', retirement_age)):
+            values = np.asarray(values, dtype=np.int64)
+            if values.shape != (n,):
+                raise ValueError(f"字段 {field} 的长度与其他字段不一致")
+            setattr(self, field, values)
+        if risk_points is None:
+            risk_points = np.full((n, 3), RISK_ANSWER_POINTS['B'], dtype=np.int8)
+        self.risk_points = np.asarray(risk_points, dtype=np.int8)
+        if self.risk_points.shape != (n, 3):
+            raise ValueError("risk_points 的形状必须为 (n, 3)")
+
+    @classmethod
+    def from_columns(cls, columns, invalid=None):
+        """由 {字段名: 等长序列} 构造（缺失字段使用默认值）；已经是 ClientBook 时原样返回
+
+        invalid 见 _int_column: 给出时无法转换的数字只标记该行，不抛出异常。
+        """
+        if isinstance(columns, cls):
+            return columns
+        for field in BATCH_REQUIRED_FIELDS:
+            if field in columns:
+                n = len(columns[field])
+                break
+        else:
+            raise ValueError("批量输入至少需要包含 age 字段")
+
+        risk_points = np.empty((n, 3), dtype=np.int8)
+        for i in range(3):
+            risk_points[:, i] = _risk_points_column(columns, f'risk_q{i + 1}', n)
+        return cls(
+            _int_column(columns, 'age', 30, n, invalid),
+            _int_column(columns, 'annual_income', 0, n, invalid),
+            _int_column(columns, 'current_assets', 0, n, invalid),
+            _int_column(columns, 'monthly_expenses', 5000, n, invalid),
+            _int_column(columns, 'retirement_age', 60, n, invalid),
+            risk_points
+        )
+
+    @classmethod
+    def from_profiles(cls, profiles):
+        """由 ClientProfile（或 user_data 字典）序列构造"""
+        profiles = [ClientProfile.from_mapping(profile) for profile in profiles]
+        return cls(
+            [p.age for p in profiles], [p.annual_income for p in profiles], [p.current_assets for p in profiles],
+            [p.monthly_expenses for p in profiles], [p.retirement_age for p in profiles],
+            np.array([[RISK_ANSWER_POINTS.get(answer, 0) for answer in (p.risk_q1, p.risk_q2, p.risk_q3)]
+                      for p in profiles], dtype=np.int8).reshape(len(profiles), 3)
+        )
+
+    def __len__(self):
+        return len(self.age)
+
+    def take(self, indices):
+        """取出指定行组成新的 ClientBook"""
+        return ClientBook(*(getattr(self, field)[indices] for field in self.__slots__))
+
+    def profile(self, index):
+        """取出第 index 行的 ClientProfile（得分为 0 的答案还原为空字符串）"""
+        answers = ['ABC'[points - 1] if points else '' for points in self.risk_points[index].tolist()]
+        return ClientProfile(int(self.age[index]), int(self.annual_income[index]), int(self.current_assets[index]),
+                             int(self.monthly_expenses[index]), int(self.retirement_age[index]), *answers)
+
+    def columns(self):
+        """数值字段的列字典（不含风险答案）"""
+        return {field: getattr(self, field) for field in BATCH_REQUIRED_FIELDS}
+
+    def fingerprint(self):
+        """各行规范化输入与 ASSUMPTIONS_VERSION 的 64 位内容哈希（uint64 数组）
+
+        不含年龄：年龄每年都会变化，由调用方单独比较，以便区分资料变更和跨越年龄段。
+        """
+        fingerprint = np.full(len(self), _FINGERPRINT_SEED, dtype=np.uint64)
+        for column in (self.annual_income, self.current_assets, self.monthly_expenses, self.retirement_age,
+                       *self.risk_points.T):
+            fingerprint = _mix64(fingerprint ^ _mix64(column.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)))
+        return fingerprint
+
+# 规划会话允许修改的字段
+PLAN_SESSION_FIELDS = BATCH_REQUIRED_FIELDS + ('risk_q1', 'risk_q2', 'risk_q3')
+
+# generate_comprehensive_plan 各阶段的依赖图，按拓扑顺序排列:
+#   (阶段名, 读取的输入字段, 依赖的上游阶段)
+# 规则建议只用到年龄，配置和养老需求通过上游阶段传入。
+PLAN_STAGE_GRAPH = (
+    ("allocation", ("age", "current_assets", "risk_q1", "risk_q2", "risk_q3"), ()),
+    ("retirement_needs", ("age", "retirement_age", "monthly_expenses"), ()),
+    ("product_recommendations", (), ("allocation",)),
+    ("advice", ("age",), ("allocation", "retirement_needs")),
+)
+
+# ---------- 蒙特卡洛模拟假设 ----------
+# 各资产类别的年化收益率 (均值, 标准差)，顺序同 ASSET_CLASSES
+ASSET_RETURN_MEAN = np.array([0.07, 0.035, 0.02, 0.05])
+ASSET_RETURN_VOL = np.array([0.18, 0.05, 0.005, 0.12])
+# 资产类别之间的相关系数矩阵
+ASSET_RETURN_CORRELATION = np.array([
+    [1.00, 0.10, 0.00, 0.40],
+    [0.10, 1.00, 0.20, 0.05],
+    [0.00, 0.20, 1.00, 0.00],
+    [0.40, 0.05, 0.00, 1.00],
+])
+# 相关系数矩阵的 Cholesky 分解，导入时算好（预加载部署时由各 worker 共享）
+ASSET_RETURN_CHOLESKY = np.linalg.cholesky(ASSET_RETURN_CORRELATION)
+ASSET_RETURN_CHOLESKY.setflags(write=False)
+INFLATION_MEAN = 0.03
+INFLATION_VOL = 0.01
+RETIREMENT_YEARS = 25
+SIMULATION_PERCENTILES = (5, 25, 50, 75, 95)
+# 每个模拟分块的路径数；分块与随机种子一一对应，保证是否使用进程池结果都一致
+SIMULATION_CHUNK_PATHS = 20000
+
+# ---------- 确定性现金流预测 ----------
+# 积累期年收入增长率
+INCOME_GROWTH_RATE = 0.03
+# 每块客户数；中间结果用 float64 按块计算，输出为 float32
+PROJECTION_CHUNK_CLIENTS = 20000
+
+# ---------- 再平衡 ----------
+# 容忍带（"5/25 规则"）: 偏离目标超过 5 个百分点或目标比例的 25%（取较小者）才需要交易
+REBALANCE_TOLERANCE = 5
+REBALANCE_RELATIVE_TOLERANCE = 0.25
+
+
+def _simulate_chunk(params, seed_sequence, n_paths):
+    """模拟一个分块的路径，返回 (退休时资产, 退休期末资产, 是否成功, 累计通胀)"""
+    rng = np.random.default_rng(seed_sequence)
+    years_to_retire = params["years_to_retire"]
+    retirement_years = params["retirement_years"]
+    total_years = years_to_retire + retirement_years
+    weights = params["weights"]
+
+    # 通胀矩阵 (paths × years)
+    inflation = rng.standard_normal(size=(n_paths, total_years), dtype=np.float32)
+    price_level = np.cumprod(1 + INFLATION_MEAN + INFLATION_VOL * inflation, axis=1, dtype=np.float64)
+
+    # 各资产类别收益率 = 均值 + 波动率 × (L · 独立冲击)，L 为相关矩阵的 Cholesky 分解。
+    # 组合收益率 (paths × years) 为其按配置比例的加权和，这里先把 L、波动率和权重
+    # 合并成一个向量，避免生成完整的 (paths × years × 资产类别) 收益率张量。
+    shocks = rng.standard_normal(size=(n_paths * total_years, len(ASSET_CLASSES)), dtype=np.float32)
+    loading = params["cholesky"].T @ (ASSET_RETURN_VOL * weights)
+    portfolio_returns = (ASSET_RETURN_MEAN @ weights + shocks @ loading.astype(np.float32)).reshape(n_paths, total_years)
+
+    # 现金流矩阵: 积累期按通胀增长的储蓄投入，退休期按通胀增长的支出取款
+    cash_flows = np.empty((n_paths, total_years))
+    cash_flows[:, :years_to_retire] = params["annual_contribution"] * price_level[:, :years_to_retire]
+    cash_flows[:, years_to_retire:] = -params["annual_expenses"] * price_level[:, years_to_retire:]
+
+    balance = np.full(n_paths, float(params["current_assets"]))
+    depleted = np.zeros(n_paths, dtype=bool)
+    wealth_at_retirement = balance
+    for year in range(total_years):
+        if year == years_to_retire:
+            wealth_at_retirement = balance.copy()
+        balance = balance * (1 + portfolio_returns[:, year]) + cash_flows[:, year]
+        depleted |= balance < 0
+    if years_to_retire == total_years:
+        wealth_at_retirement = balance.copy()
+
+    return wealth_at_retirement, np.maximum(balance, 0), ~depleted, price_level[:, -1]
+
+def project_cash_flows(age, retirement_age, current_assets, annual_income, monthly_expenses, weights,
+                       annual_contribution=None, retirement_years=RETIREMENT_YEARS, years=None,
+                       income_growth=INCOME_GROWTH_RATE):
+    """逐年预测积累期和退休期的资产余额（按期望收益率的确定性路径）
+
+    各参数为长度 n 的数组（weights 为 (n, 4) 的配置比例，列顺序见 ASSET_CLASSES）。
+    第 t 年（t 从 0 起，对应年龄 age + t）的现金流与 simulate_retirement 一致:
+    积累期投入 年收入 × (1+收入增长)^(t+1) - 年支出 × (1+通胀)^(t+1)（不为负），
+    或按通胀增长的 annual_contribution；退休后 retirement_years 年内按通胀增长的年支出取款。
+    年末余额 = 年初余额 × (1 + 组合期望收益率) + 当年现金流。
+
+    线性递推按闭式解一次算出整个 (客户 × 年份) 矩阵:
+        B[t] = g^(t+1) × (B0 + Σ_{k<=t} cf[k] / g^(k+1))，g = 1 + 组合收益率
+    years 默认为最长的 距退休年数 + retirement_years；超出客户自身期限的年份为 NaN。
+    """
+    age = np.asarray(age, dtype=np.int64)
+    retirement_age = np.asarray(retirement_age, dtype=np.int64)
+    current_assets = np.asarray(current_assets, dtype=np.float64)
+    annual_income = np.asarray(annual_income, dtype=np.float64)
+    annual_expenses = np.asarray(monthly_expenses, dtype=np.float64) * 12
+    weights = np.asarray(weights, dtype=np.float64).reshape(len(age), len(ASSET_CLASSES))
+    n = len(age)
+
+    years_to_retire = retirement_age - age
+    if np.any(years_to_retire <= 0):
+        raise ValueError("退休年龄必须大于当前年龄")
+    horizon = years_to_retire + int(retirement_years)
+    if years is None:
+        years = int(horizon.max()) if n else 0
+
+    portfolio_return = weights @ ASSET_RETURN_MEAN
+    balance = np.empty((n, years), dtype=np.float32)
+    cash_flow = np.empty((n, years), dtype=np.float32)
+    t = np.arange(years)
+    inflation_index = (1 + INFLATION_MEAN) ** (t + 1)
+    income_index = (1 + income_growth) ** (t + 1)
+
+    for start in range(0, n, PROJECTION_CHUNK_CLIENTS):
+        rows = slice(start, start + PROJECTION_CHUNK_CLIENTS)
+        accumulating = t < years_to_retire[rows, None]
+        active = t < horizon[rows, None]
+
+        if annual_contribution is None:
+            contribution = np.maximum(
+                0, annual_income[rows, None] * income_index - annual_expenses[rows, None] * inflation_index
+            )
+        else:
+            contribution = np.asarray(annual_contribution, dtype=np.float64)[rows, None] * inflation_index
+        flows = np.where(accumulating, contribution, -annual_expenses[rows, None] * inflation_index)
+        flows[~active] = 0
+
+        growth = (1 + portfolio_return[rows, None]) ** (t + 1)
+        chunk_balance = np.cumsum(flows / growth, axis=1)
+        chunk_balance += current_assets[rows, None]
+        chunk_balance *= growth
+        chunk_balance[~active] = np.nan
+
+        balance[rows] = chunk_balance
+        cash_flow[rows] = flows
+
+    # 余额首次为负的年份（-1 表示期限内不会耗尽）
+    depleted = balance < 0
+    depletion_year = np.where(depleted.any(axis=1), depleted.argmax(axis=1), -1).astype(np.int32)
+    retirement_index = np.minimum(years_to_retire, years) - 1
+    wealth_at_retirement = balance[np.arange(n), retirement_index] if years else np.zeros(n, dtype=np.float32)
+    wealth_at_retirement[years_to_retire > years] = np.nan
+
+    return {
+        "years": years,
+        "years_to_retire": years_to_retire.astype(np.int32),
+        "portfolio_return": portfolio_return.astype(np.float32),
+        "balance": balance,
+        "cash_flow": cash_flow,
+        "wealth_at_retirement": wealth_at_retirement,
+        "depletion_year": depletion_year,
+    }
+
+def _fill(weights, amount, room, direction):
+    """把 amount（每行一个非负数）按各列空间 room（非负）的比例加到（direction=1）或
+    减出（direction=-1）weights，返回 (新的 weights, 未分配的 amount)"""
+    room = np.maximum(room, 0)
+    available = room.sum(axis=1)
+    used = np.minimum(amount, available)
+    share = np.divide(used, available, out=np.zeros_like(used), where=available > 0)
+    return weights + direction * room * share[:, None], amount - used
+
+
+def rebalance_trades(holdings, targets, tolerance=REBALANCE_TOLERANCE,
+                     relative_tolerance=REBALANCE_RELATIVE_TOLERANCE):
+    """计算多个账户回到容忍带内所需的最小换手交易
+
+    holdings 为 (n, 4) 的各资产类别当前市值，targets 为 (n, 4) 的目标百分比（列顺序见 ASSET_CLASSES）。
+    每个类别的容忍带为 目标 ± min(tolerance 个百分点, relative_tolerance × 目标)；
+    relative_tolerance 为 None 时只用绝对容忍带。
+
+    全部类别都在带内的账户不交易；否则只把越界的类别调整到最近的带边界，
+    这是任何可行方案都必须完成的交易量，因此换手最小。由此产生的买卖差额
+    由带内类别补齐：先向各自目标靠拢，不够时再用到带边界为止的空间。
+    账户总市值不变（买入额等于卖出额）。
+
+    返回 trades（正数买入、负数卖出的金额）、weights_after（交易后的比例）、
+    turnover（单边换手金额）和 needs_rebalance（是否需要交易）。
+    """
+    holdings = np.asarray(holdings, dtype=np.float64)
+    targets = np.asarray(targets, dtype=np.float64).reshape(holdings.shape) / 100
+    total = holdings.sum(axis=1)
+    funded = total > 0
+    weights = np.divide(holdings, total[:, None], out=np.zeros_like(holdings), where=funded[:, None])
+
+    band = np.full_like(targets, tolerance / 100)
+    if relative_tolerance is not None:
+        band = np.minimum(band, relative_tolerance * targets)
+    lower = np.maximum(targets - band, 0)
+    upper = np.minimum(targets + band, 1)
+
+    # 越界类别调整到带边界；容差内的浮点误差不视为越界
+    outside = ((weights < lower - 1e-12) | (weights > upper + 1e-12)) & funded[:, None]
+    adjusted = np.where(outside, np.clip(weights, lower, upper), weights)
+
+    # 补齐买卖差额: gap > 0 需要再买入，gap < 0 需要再卖出
+    gap = np.where(outside.any(axis=1), 1 - adjusted.sum(axis=1), 0)
+    buy = np.maximum(gap, 0)
+    adjusted, buy = _fill(adjusted, buy, targets - adjusted, 1)
+    adjusted, buy = _fill(adjusted, buy, upper - np.maximum(adjusted, targets), 1)
+    sell = np.maximum(-gap, 0)
+    adjusted, sell = _fill(adjusted, sell, adjusted - targets, -1)
+    adjusted, sell = _fill(adjusted, sell, np.minimum(adjusted, targets) - lower, -1)
+
+    trades = (adjusted - weights) * total[:, None]
+    return {
+        "trades": trades,
+        "weights_after": adjusted,
+        "turnover": np.abs(trades).sum(axis=1) / 2,
+        "needs_rebalance": outside.any(axis=1),
+    }
+
 
 class PensionAdvisorCore:
-    def __init__(self, use_ai=True):
+    def __init__(self, use_ai=True, ollama_url=None, ollama_model=None, product_catalog=None):
         self.use_ai = use_ai
         # 注意：为了简化部署，我们默认不使用AI模型
-        # 如果需要AI功能，可以在Zeabur上配置Ollama
+        # 如果需要AI功能，可以在Zeabur上配置Ollama（设置 OLLAMA_HOST 后流式建议接口会调用模型）
+        self.ollama_url = ollama_url or os.environ.get('OLLAMA_HOST')
+        self.ollama_model = ollama_model or os.environ.get('OLLAMA_MODEL', 'deepseek-r1:1.5b')
+        # 可选的阶段耗时回调 stage_observer(stage, seconds)，用于监控指标；为 None 时不计时
+        self.stage_observer = None
+        # 产品目录（默认读取 product_catalog.csv，文件修改后自动重新加载）
+        self.product_catalog = product_catalog if product_catalog is not None else ProductCatalog()
     
     def calculate_retirement_needs(self, user_data):
         """计算养老资金需求"""
+        profile = ClientProfile.from_mapping(user_data)
+        age = profile.age
+        retirement_age = profile.retirement_age
+        monthly_expenses = profile.monthly_expenses
         try:
-            age = int(user_data.get('age', 30))
-            retirement_age = int(user_data.get('retirement_age', 60))
-            monthly_expenses = int(user_data.get('monthly_expenses', 5000))
             annual_expenses = monthly_expenses * 12
             
-            # 养老资金估算
-            retirement_years = 25
-            inflation_rate = 1.03
+            # 养老资金估算（确定性估算；概率分析见 simulate_retirement）
+            retirement_years = RETIREMENT_YEARS
+            inflation_rate = 1 + INFLATION_MEAN
             years_to_retire = retirement_age - age
             
             future_annual_expenses = annual_expenses * (inflation_rate ** years_to_retire)
@@ -32,7 +621,7 @@ class PensionAdvisorCore:
         except Exception as e:
             # 简化计算作为备选
             years_to_retire = retirement_age - age
-            total_needed = monthly_expenses * 12 * 25
+            total_needed = monthly_expenses * 12 * RETIREMENT_YEARS
             return {
                 "years_to_retire": years_to_retire,
                 "annual_expenses": monthly_expenses * 12,
@@ -42,17 +631,9 @@ class PensionAdvisorCore:
     
     def calculate_risk_profile(self, user_data):
         """计算风险偏好"""
-        score = 0
-        for i in range(1, 4):
-            answer = user_data.get(f'risk_q{i}', 'B').upper()
-            if answer == 'A':
-                score += 1
-            elif answer == 'B':
-                score += 2
-            elif answer == 'C':
-                score += 3
-        
-        age = int(user_data.get('age', 30))
+        profile = ClientProfile.from_mapping(user_data)
+        score = profile.risk_points
+        age = profile.age
         
         # 年龄调整
         age_factor = max(0, (40 - age) / 20)
@@ -67,61 +648,140 @@ class PensionAdvisorCore:
     
     def generate_portfolio_allocation(self, user_data):
         """生成投资组合配置"""
-        risk_type, score = self.calculate_risk_profile(user_data)
-        age = int(user_data['age'])
-        assets = int(user_data.get('current_assets', 0))
-        
-        # 配置逻辑
-        if risk_type == "保守型":
-            if age < 35:
-                allocation = {"股票": 20, "债券": 50, "现金": 25, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 15, "债券": 55, "现金": 25, "另类投资": 5}
-            else:
-                allocation = {"股票": 10, "债券": 60, "现金": 25, "另类投资": 5}
-                
-        elif risk_type == "稳健型":
-            if age < 35:
-                allocation = {"股票": 50, "债券": 35, "现金": 10, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 40, "债券": 40, "现金": 15, "另类投资": 5}
-            else:
-                allocation = {"股票": 30, "债券": 45, "现金": 20, "另类投资": 5}
-                
-        else:  # 进取型
-            if age < 35:
-                allocation = {"股票": 70, "债券": 20, "现金": 5, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 60, "债券": 25, "现金": 10, "另类投资": 5}
-            else:
-                allocation = {"股票": 50, "债券": 30, "现金": 15, "另类投资": 5}
+        profile = ClientProfile.from_mapping(user_data)
+        risk_type, score = self.calculate_risk_profile(profile)
         
-        # 资产规模调整
-        if assets > 500000:
-            allocation["另类投资"] += 5
-            allocation["股票"] -= 3
-            allocation["债券"] -= 2
+        allocation = lookup_allocation(risk_type, profile.age, profile.current_assets)
         
         return allocation, risk_type
     
-    def get_product_recommendations(self, allocation):
-        """获取产品推荐"""
-        product_database = {
-            "股票": ["沪深300指数基金", "中证500指数基金", "科技行业基金", "消费行业基金"],
-            "债券": ["国债", "地方政府债基金", "高等级企业债基金", "可转债基金"],
-            "现金": ["货币市场基金", "银行理财产品", "短期定期存款"],
-            "另类投资": ["黄金ETF", "REITs基金", "大宗商品基金"]
+    def simulate_retirement(self, user_data, allocation=None, n_paths=10000, seed=None,
+                            retirement_years=RETIREMENT_YEARS, processes=None):
+        """蒙特卡洛模拟养老资金充足概率
+
+        在 (路径 × 年份) 矩阵上同时模拟通胀、各资产类别收益和退休期取款。
+        积累期每年投入 annual_contribution（默认为年收入减年支出），退休后
+        每年按通胀调整后的年支出取款，全程资产不为负即视为成功。
+        路径数超过 SIMULATION_CHUNK_PATHS 时按分块拆分，processes > 1 时
+        使用进程池并行；相同 seed 下结果与是否并行无关。
+        """
+        profile = ClientProfile.from_mapping(user_data)
+        annual_expenses = profile.monthly_expenses * 12
+        years_to_retire = profile.retirement_age - profile.age
+        if years_to_retire <= 0:
+            raise ValueError("退休年龄必须大于当前年龄")
+        if n_paths <= 0:
+            raise ValueError("模拟路径数必须为正数")
+
+        if allocation is None:
+            allocation, _ = self.generate_portfolio_allocation(profile)
+        weights = np.array([allocation.get(category, 0) for category in ASSET_CLASSES], dtype=float) / 100
+
+        annual_contribution = profile.annual_contribution
+        if annual_contribution is None:
+            annual_contribution = max(0, profile.annual_income - annual_expenses)
+
+        params = {
+            "years_to_retire": years_to_retire,
+            "retirement_years": int(retirement_years),
+            "weights": weights,
+            "cholesky": ASSET_RETURN_CHOLESKY,
+            "current_assets": profile.current_assets,
+            "annual_contribution": float(annual_contribution),
+            "annual_expenses": float(annual_expenses),
+        }
+
+        chunk_sizes = [SIMULATION_CHUNK_PATHS] * (n_paths // SIMULATION_CHUNK_PATHS)
+        if n_paths % SIMULATION_CHUNK_PATHS:
+            chunk_sizes.append(n_paths % SIMULATION_CHUNK_PATHS)
+        seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+
+        if processes is None:
+            processes = min(len(chunk_sizes), os.cpu_count() or 1)
+        if processes > 1 and len(chunk_sizes) > 1:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                chunks = list(pool.map(_simulate_chunk, [params] * len(chunk_sizes), seeds, chunk_sizes))
+        else:
+            chunks = [_simulate_chunk(params, s, size) for s, size in zip(seeds, chunk_sizes)]
+
+        wealth_at_retirement, terminal_wealth, success, price_level = (
+            np.concatenate(parts) for parts in zip(*chunks)
+        )
+
+        def percentiles(values):
+            return {f"p{q}": int(v) for q, v in zip(SIMULATION_PERCENTILES, np.percentile(values, SIMULATION_PERCENTILES))}
+
+        return {
+            "paths": n_paths,
+            "seed": seed,
+            "years_to_retire": years_to_retire,
+            "retirement_years": int(retirement_years),
+            "annual_contribution": int(annual_contribution),
+            "success_probability": round(float(success.mean()), 4),
+            "wealth_at_retirement": percentiles(wealth_at_retirement),
+            "terminal_wealth": percentiles(terminal_wealth),
+            "cumulative_inflation": {
+                f"p{q}": round(float(v), 4)
+                for q, v in zip(SIMULATION_PERCENTILES, np.percentile(price_level, SIMULATION_PERCENTILES))
+            }
+        }
+
+    def project_cash_flows(self, user_data, allocation=None, retirement_years=RETIREMENT_YEARS):
+        """单客户逐年现金流预测，返回一维数组（详见模块级 project_cash_flows）"""
+        profile = ClientProfile.from_mapping(user_data)
+        if allocation is None:
+            allocation, _ = self.generate_portfolio_allocation(profile)
+        weights = [[allocation.get(category, 0) / 100 for category in ASSET_CLASSES]]
+        annual_contribution = profile.annual_contribution
+
+        projection = project_cash_flows(
+            [profile.age], [profile.retirement_age], [profile.current_assets], [profile.annual_income],
+            [profile.monthly_expenses], weights,
+            annual_contribution=None if annual_contribution is None else [annual_contribution],
+            retirement_years=retirement_years
+        )
+        result = {key: value[0] if isinstance(value, np.ndarray) else value for key, value in projection.items()}
+        result["age"] = np.arange(projection["years"], dtype=np.int32) + profile.age
+        return result
+
+    def generate_glidepath(self, user_data):
+        """从当前年龄到退休年龄（含）逐年的资产配置（GLIDEPATH_TABLE 的一段）
+
+        风险类型和资产档位按当前情况确定，整条路径沿用。
+        """
+        profile = ClientProfile.from_mapping(user_data)
+        risk_type, _ = self.calculate_risk_profile(profile)
+        wealthy = profile.current_assets > WEALTHY_ASSETS_THRESHOLD
+        ages = np.arange(profile.age, max(profile.retirement_age, profile.age) + 1)
+        path = GLIDEPATH_TABLE[RISK_TYPES.index(risk_type), int(wealthy), glidepath_rows(ages)]
+
+        return {
+            "risk_profile": risk_type,
+            "wealthy": wealthy,
+            "ages": ages.tolist(),
+            "allocation": {
+                category: np.round(path[:, i], 2).tolist() for i, category in enumerate(ASSET_CLASSES)
+            }
         }
+
+    def get_product_recommendations(self, allocation, risk_type=None):
+        """获取产品推荐：每个资产类别按配置比例取产品目录中排名最前的产品
+
+        给出 risk_type 时只推荐风险等级不超过该风险类型上限的产品。
+        """
+        catalog = self.product_catalog
+        catalog.maybe_reload()
         
         recommendations = {}
         for category, percentage in allocation.items():
-            if percentage > 0 and category in product_database:
-                products = product_database[category]
-                num_products = min(len(products), max(1, percentage // 20))
-                recommendations[category] = {
-                    "percentage": percentage,
-                    "products": products[:num_products]
-                }
+            if percentage > 0:
+                products = catalog.top_products(category, max(1, percentage // 20), risk_type)
+                if products:
+                    recommendations[category] = {
+                        "percentage": percentage,
+                        "products": [product.name for product in products],
+                        "details": [product._asdict() for product in products]
+                    }
         
         return recommendations
     
@@ -140,16 +800,66 @@ class PensionAdvisorCore:
         advice += " 本建议基于标准理财规则生成，投资有风险，决策需谨慎。"
         return advice
     
+    def stream_ai_advice(self, user_data, allocation, risk_type, retirement_data):
+        """逐段生成AI建议（已过滤 <think> 推理块）；未配置 Ollama 或调用失败时使用规则建议"""
+        if self.use_ai and self.ollama_url:
+            profile = {
+                "age": user_data['age'],
+                "income": user_data['annual_income'],
+                "assets": user_data['current_assets'],
+                "expenses": user_data['monthly_expenses'],
+                "retirement_age": user_data['retirement_age'],
+            }
+            prompt = build_advice_prompt(profile, allocation, risk_type, retirement_data)
+            produced = False
+            try:
+                for text in filter_think_stream(stream_ollama_generate(self.ollama_url, self.ollama_model, prompt)):
+                    produced = True
+                    yield text
+            except Exception:
+                if produced:
+                    yield "（AI建议生成中断）"
+            if produced:
+                return
+        
+        yield self.generate_ai_advice(user_data, allocation, risk_type, retirement_data)
+    
     def generate_comprehensive_plan(self, user_data):
         """生成完整的养老规划"""
-        # 计算各项数据
-        allocation, risk_type = self.generate_portfolio_allocation(user_data)
-        retirement_data = self.calculate_retirement_needs(user_data)
-        product_recommendations = self.get_product_recommendations(allocation)
-        ai_advice = self.generate_ai_advice(user_data, allocation, risk_type, retirement_data)
+        # 只解析一次输入，各阶段共用
+        user_data = ClientProfile.from_mapping(user_data)
+        observer = self.stage_observer
+        if observer is None:
+            allocation, risk_type = self.generate_portfolio_allocation(user_data)
+            retirement_data = self.calculate_retirement_needs(user_data)
+            product_recommendations = self.get_product_recommendations(allocation, risk_type)
+            ai_advice = self.generate_ai_advice(user_data, allocation, risk_type, retirement_data)
+        else:
+            started = time.perf_counter()
+            allocation, risk_type = self.generate_portfolio_allocation(user_data)
+            finished = time.perf_counter()
+            observer("allocation", finished - started)
+            
+            started = finished
+            retirement_data = self.calculate_retirement_needs(user_data)
+            finished = time.perf_counter()
+            observer("retirement_needs", finished - started)
+            
+            started = finished
+            product_recommendations = self.get_product_recommendations(allocation, risk_type)
+            finished = time.perf_counter()
+            observer("product_recommendations", finished - started)
+            
+            started = finished
+            ai_advice = self.generate_ai_advice(user_data, allocation, risk_type, retirement_data)
+            observer("advice", time.perf_counter() - started)
         
-        # 组装完整结果
-        result = {
+        return self.assemble_plan(user_data, allocation, risk_type, retirement_data,
+                                  product_recommendations, ai_advice)
+
+    def assemble_plan(self, user_data, allocation, risk_type, retirement_data, product_recommendations, ai_advice):
+        """把各阶段结果组装成完整的规划结果"""
+        return {
             "user_profile": {
                 "age": user_data['age'],
                 "annual_income": user_data['annual_income'],
@@ -164,5 +874,262 @@ class PensionAdvisorCore:
             "ai_advice": ai_advice,
             "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+
+    # ---------- 批量（列式）规划 ----------
+
+    def calculate_risk_profile_batch(self, columns):
+        """批量计算风险偏好，返回 (风险类型下标数组, 调整后得分数组)"""
+        book = ClientBook.from_columns(columns)
+        score = book.risk_points.sum(axis=1, dtype=np.int64)
+
+        # 年龄调整（与单客户计算保持相同的运算顺序以保证结果一致）
+        age_factor = np.maximum(0, (40 - book.age) / 20)
+        adjusted_score = score * (1 + age_factor * 0.3)
+
+        risk_index = np.where(adjusted_score <= 3.5, 0, np.where(adjusted_score <= 6.5, 1, 2))
+        return risk_index, adjusted_score
+
+    def calculate_retirement_needs_batch(self, columns):
+        """批量计算养老资金需求"""
+        book = ClientBook.from_columns(columns)
+        age = book.age
+        retirement_age = book.retirement_age
+        annual_expenses = book.monthly_expenses * 12
+
+        retirement_years = RETIREMENT_YEARS
+        inflation_rate = 1 + INFLATION_MEAN
+        years_to_retire = retirement_age - age
+        if np.any(years_to_retire <= 0):
+            raise ValueError("退休年龄必须大于当前年龄")
+
+        future_annual_expenses = annual_expenses * (inflation_rate ** years_to_retire)
+        total_needed = future_annual_expenses * retirement_years
+
+        return {
+            "years_to_retire": years_to_retire,
+            "annual_expenses": annual_expenses,
+            "total_retirement_needed": np.trunc(total_needed).astype(np.int64),
+            "monthly_savings_needed": np.trunc(total_needed / (years_to_retire * 12)).astype(np.int64)
+        }
+
+    def generate_portfolio_allocation_batch(self, columns, risk_index=None):
+        """批量生成投资组合配置，返回 (n, 4) 的百分比矩阵，列顺序见 ASSET_CLASSES"""
+        book = ClientBook.from_columns(columns)
+        if risk_index is None:
+            risk_index, _ = self.calculate_risk_profile_batch(book)
+
+        bands = np.searchsorted(AGE_BAND_LIMITS, book.age, side='right')
+        wealthy = (book.current_assets > WEALTHY_ASSETS_THRESHOLD).astype(np.int64)
+        return _BATCH_ALLOCATION_TABLE[risk_index, bands, wealthy], risk_index
+
+    def project_cash_flows_batch(self, columns, allocation=None, retirement_years=RETIREMENT_YEARS, years=None):
+        """批量逐年现金流预测（列式输入），balance/cash_flow 为 (n, years) 的 float32 矩阵"""
+        book = ClientBook.from_columns(columns)
+        if allocation is None:
+            allocation, _ = self.generate_portfolio_allocation_batch(book)
+        return project_cash_flows(
+            book.age, book.retirement_age, book.current_assets, book.annual_income, book.monthly_expenses,
+            np.asarray(allocation) / 100,
+            retirement_years=retirement_years, years=years
+        )
+
+    def generate_glidepath_batch(self, columns, years=None):
+        """批量下滑路径（列式输入）
+
+        返回 allocation 为 (n, years, 4) 的 float32 百分比数组，第 t 列是 age + t 岁的配置，
+        超过退休年龄的位置为 NaN；years 缺省为最长的路径长度，length 为各客户的路径长度。
+        """
+        book = ClientBook.from_columns(columns)
+        risk_index, _ = self.calculate_risk_profile_batch(book)
+        wealthy = (book.current_assets > WEALTHY_ASSETS_THRESHOLD).astype(np.int64)
+        length = np.maximum(book.retirement_age - book.age, 0) + 1
+        if years is None:
+            years = int(length.max()) if len(book) else 0
+
+        # 把表展平成 (风险类型 × 资产档位 × 年龄, 4)，每个位置只需一次 take
+        offsets = np.arange(years)
+        table = _GLIDEPATH_TABLE_FLAT
+        path_start = (risk_index * 2 + wealthy) * GLIDEPATH_TABLE.shape[2]
+        rows = path_start[:, None] + glidepath_rows(book.age[:, None] + offsets)
+        allocation = table.take(rows, axis=0)
+        allocation[offsets >= length[:, None]] = np.nan
+        return {
+            "years": years,
+            "length": length,
+            "risk_index": risk_index,
+            "wealthy": wealthy.astype(bool),
+            "allocation": allocation,
+        }
+
+    def rebalance_batch(self, columns, holdings, tolerance=REBALANCE_TOLERANCE,
+                        relative_tolerance=REBALANCE_RELATIVE_TOLERANCE):
+        """按各客户的目标配置批量计算再平衡交易（详见模块级 rebalance_trades）
+
+        holdings 为 (n, 4) 的当前市值矩阵或 {资产类别: 等长序列}。
+        """
+        book = ClientBook.from_columns(columns)
+        if isinstance(holdings, dict):
+            holdings = np.column_stack([
+                np.asarray(holdings.get(category, np.zeros(len(book))), dtype=np.float64) for category in ASSET_CLASSES
+            ])
+        allocation, _ = self.generate_portfolio_allocation_batch(book)
+        result = rebalance_trades(holdings, allocation, tolerance, relative_tolerance)
+        result["targets"] = allocation
+        return result
+
+    def generate_batch_plan(self, columns):
+        """批量生成养老规划（列式输入，列式输出）
+
+        columns 为 {字段名: 等长序列} 或 ClientBook，返回的数值列均为 NumPy 数组，
+        各行结果与 generate_comprehensive_plan 的单客户结果一致。
+        无效的行（数字无法转换，或退休年龄不大于当前年龄）不影响其他行: valid 标记各行是否有效，
+        errors 为 [(行下标, 错误信息)]，无效行的数值结果为 0、risk_index 为 -1、risk_profile 为 None。
+        """
+        if isinstance(columns, ClientBook):
+            book = columns
+            invalid = np.zeros(len(book), dtype=bool)
+        else:
+            for field in BATCH_REQUIRED_FIELDS:
+                if field not in columns:
+                    raise ValueError(f"缺少必需字段: {field}")
+            invalid = np.zeros(len(columns[BATCH_REQUIRED_FIELDS[0]]), dtype=bool)
+            book = ClientBook.from_columns(columns, invalid)
+        unparsable = invalid.copy()
+        invalid |= book.retirement_age <= book.age
+
+        # 只计算有效行，再按行下标放回完整长度的结果
+        valid_rows = np.flatnonzero(~invalid)
+        valid_book = book.take(valid_rows) if len(valid_rows) < len(book) else book
+
+        def scatter(values, fill=0):
+            if valid_book is book:
+                return values
+            result = np.full(len(book), fill, dtype=values.dtype)
+            result[valid_rows] = values
+            return result
+
+        risk_index, risk_score = self.calculate_risk_profile_batch(valid_book)
+        allocation, _ = self.generate_portfolio_allocation_batch(valid_book, risk_index)
+        retirement_data = self.calculate_retirement_needs_batch(valid_book)
+        risk_index = scatter(risk_index, -1)
+        risk_profile = np.full(len(book), None, dtype=object)
+        risk_profile[valid_rows] = np.asarray(RISK_TYPES, dtype=object)[risk_index[valid_rows]]
+
+        errors = [(row, "请输入有效的数字" if unparsable[row] else "退休年龄必须大于当前年龄")
+                  for row in np.flatnonzero(invalid).tolist()]
+        return {
+            "count": len(book),
+            "user_profile": book.columns(),
+            "valid": ~invalid,
+            "errors": errors,
+            "risk_index": risk_index,
+            "risk_profile": risk_profile,
+            "risk_score": scatter(risk_score),
+            "retirement_analysis": {key: scatter(values) for key, values in retirement_data.items()},
+            "portfolio_allocation": {
+                category: scatter(allocation[:, i]) for i, category in enumerate(ASSET_CLASSES)
+            },
+            "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+
+class PlanSession:
+    """增量规划会话：按阶段依赖图缓存各阶段结果，修改字段后只重算受影响的阶段
+
+    某阶段需要重算的条件是它读取的输入字段有变化，或者某个上游阶段的结果有变化；
+    重算后结果与原来相同（例如资产变化但未跨过 50 万）时，下游阶段继续沿用旧结果。
+    """
+
+    def __init__(self, advisor, user_data):
+        self.advisor = advisor
+        self.user_data = validate_plan_input(user_data)
+        self.version = 0
+        self._outputs = {}
+        self._lock = threading.Lock()
+        self.last_recomputed = self._recompute(self.user_data, set(PLAN_SESSION_FIELDS))
+
+    def state(self):
+        """可保存到会话存储中的会话状态（只含 JSON 类型: 配置阶段的 (配置, 风险类型) 转为列表）"""
+        with self._lock:
+            outputs = dict(self._outputs)
+            allocation, risk_type = outputs["allocation"]
+            outputs["allocation"] = [dict(allocation), risk_type]
+            return {
+                "user_data": self.user_data,
+                "version": self.version,
+                "outputs": outputs,
+                "last_recomputed": self.last_recomputed,
+            }
+
+    @classmethod
+    def from_state(cls, advisor, state):
+        """由 state() 的结果（或其 JSON 往返后的结果）恢复会话，不重新计算"""
+        session = cls.__new__(cls)
+        session.advisor = advisor
+        session.user_data = state["user_data"]
+        session.version = state["version"]
+        outputs = dict(state["outputs"])
+        allocation, risk_type = outputs["allocation"]
+        outputs["allocation"] = (FrozenAllocation(allocation), risk_type)
+        session._outputs = outputs
+        session._lock = threading.Lock()
+        session.last_recomputed = state["last_recomputed"]
+        return session
+
+    def _run_stage(self, name, profile, outputs):
+        advisor = self.advisor
+        if name == "allocation":
+            return advisor.generate_portfolio_allocation(profile)
+        if name == "retirement_needs":
+            return advisor.calculate_retirement_needs(profile)
+        if name == "product_recommendations":
+            return advisor.get_product_recommendations(*outputs["allocation"])
+        allocation, risk_type = outputs["allocation"]
+        return advisor.generate_ai_advice(profile, allocation, risk_type, outputs["retirement_needs"])
+
+    def _recompute(self, user_data, changed_fields):
+        """按依赖图重算受影响的阶段，全部成功后才替换会话状态，返回重算的阶段名"""
+        observer = self.advisor.stage_observer
+        profile = ClientProfile.from_mapping(user_data)
+        outputs = dict(self._outputs)
+        changed_stages = set()
+        recomputed = []
+        for name, fields, upstream in PLAN_STAGE_GRAPH:
+            if name in outputs and changed_fields.isdisjoint(fields) and changed_stages.isdisjoint(upstream):
+                continue
+            started = time.perf_counter()
+            output = self._run_stage(name, profile, outputs)
+            if observer is not None:
+                observer(name, time.perf_counter() - started)
+            if name not in outputs or outputs[name] != output:
+                changed_stages.add(name)
+            outputs[name] = output
+            recomputed.append(name)
         
-        return result
\ No newline at end of file
+        self.user_data = user_data
+        self._outputs = outputs
+        self.version += 1
+        return recomputed
+
+    def update(self, delta):
+        """合并字段修改并增量重算，返回本次重算的阶段名列表"""
+        if not isinstance(delta, dict):
+            raise PlanInputError("请求数据必须是 JSON 对象")
+        unknown = [field for field in delta if field not in PLAN_SESSION_FIELDS]
+        if unknown:
+            raise PlanInputError(f"不支持修改的字段: {', '.join(unknown)}")
+        
+        with self._lock:
+            user_data = validate_plan_input({**self.user_data, **delta})
+            changed_fields = {field for field in PLAN_SESSION_FIELDS if user_data[field] != self.user_data[field]}
+            self.last_recomputed = self._recompute(user_data, changed_fields) if changed_fields else []
+            return self.last_recomputed
+
+    def plan(self):
+        """当前的完整规划结果"""
+        with self._lock:
+            allocation, risk_type = self._outputs["allocation"]
+            return self.advisor.assemble_plan(
+                self.user_data, allocation, risk_type, self._outputs["retirement_needs"],
+                self._outputs["product_recommendations"], self._outputs["advice"]
+            )
@@ -1,16 +1,124 @@
 # app.py - Flask Web 应用
-from flask import Flask, render_template, request, jsonify
-from advisor_core import PensionAdvisorCore
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+from advisor_core import (PensionAdvisorCore, PlanInputError, PlanSession, validate_plan_input,
+                          BATCH_REQUIRED_FIELDS, ASSUMPTIONS_VERSION, ASSET_CLASSES, RISK_TYPES)
+from plan_cache import PlanCache
+from session_store import PlanSessionStore
+import plan_formats
+import metrics
+import profiling
 import json
+import numpy as np
 from datetime import datetime
 import os
+import secrets
 from flask import Flask, render_template, request, jsonify
 # ... 其他导入
 
 app = Flask(__name__)
 
+# 规划结果缓存配置（可通过环境变量调整，PLAN_CACHE_SIZE=0 关闭缓存）
+app.config['PLAN_CACHE_SIZE'] = int(os.environ.get('PLAN_CACHE_SIZE', 1024))
+app.config['PLAN_CACHE_TTL'] = int(os.environ.get('PLAN_CACHE_TTL', 300))
+
+# 增量规划会话（保存在本机各 worker 进程共享的 SQLite 文件中，多台机器部署时需要共享该文件或按会话粘滞路由）
+app.config['PLAN_SESSION_DB'] = os.environ.get('PLAN_SESSION_DB', 'plan_sessions.sqlite3')
+app.config['PLAN_SESSION_LIMIT'] = int(os.environ.get('PLAN_SESSION_LIMIT', 10000))
+app.config['PLAN_SESSION_TTL'] = int(os.environ.get('PLAN_SESSION_TTL', 1800))
+
+# 请求性能剖析配置（PROFILE_SAMPLE_RATE 为采样比例，0 表示只剖析管理员显式要求的请求）
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+app.config['PROFILE_MAX_FILES'] = int(os.environ.get('PROFILE_MAX_FILES', 200))
+# 管理接口令牌，未设置时管理接口不可用
+app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN')
+
 # 初始化养老规划核心
 advisor = PensionAdvisorCore()
+plan_cache = PlanCache(maxsize=app.config['PLAN_CACHE_SIZE'], ttl=app.config['PLAN_CACHE_TTL'])
+plan_sessions = PlanSessionStore(app.config['PLAN_SESSION_DB'], maxsize=app.config['PLAN_SESSION_LIMIT'],
+                                 ttl=app.config['PLAN_SESSION_TTL'])
+
+# Prometheus 监控指标（/metrics）
+metrics.init_app(app, advisor)
+
+# 按需采样的请求剖析与管理接口（/admin/profiles）
+profiling.init_app(app)
+
+# 单个请求允许的最大蒙特卡洛模拟路径数
+MAX_SIMULATION_PATHS = 100000
+
+# NDJSON 批量接口单行最大字节数
+MAX_NDJSON_LINE_BYTES = 64 * 1024
+
+# 会话被其他 worker 同时修改时 PATCH 的最大重试次数
+PLAN_SESSION_UPDATE_ATTEMPTS = 5
+
+def _plan_cache_key(full_user_data, simulation=None):
+    """由规范化输入生成规划缓存键（同时用作 ETag）"""
+    # 命中缓存或返回 304 的请求不会调用产品推荐，这里检查目录文件是否变化（有节流），目录变化后键随之改变
+    advisor.product_catalog.maybe_reload()
+    return plan_cache.make_key('plan', {
+        **full_user_data,
+        **{f'risk_q{i}': _normalize_risk_answer(full_user_data[f'risk_q{i}']) for i in range(1, 4)},
+        'simulation': simulation,
+        'assumptions': ASSUMPTIONS_VERSION,
+        'catalog': advisor.product_catalog.version
+    })
+
+def _simulate(full_user_data, plan_result, simulation):
+    return advisor.simulate_retirement(
+        full_user_data, plan_result["portfolio_allocation"],
+        n_paths=simulation["paths"], seed=simulation["seed"], processes=1
+    )
+
+def _cached_plan(cache_key, full_user_data, simulation=None):
+    """先查缓存，未命中时生成规划并写入缓存
+
+    未指定随机种子的模拟每次结果不同，不缓存: 只复用确定性部分的缓存，模拟每次重新计算。
+    """
+    if simulation is not None and simulation["seed"] is None:
+        plan_result = dict(_cached_plan(_plan_cache_key(full_user_data), full_user_data))
+        plan_result["retirement_simulation"] = _simulate(full_user_data, plan_result, simulation)
+        return plan_result
+    
+    plan_result = plan_cache.get(cache_key)
+    if plan_result is None:
+        plan_result = advisor.generate_comprehensive_plan(full_user_data)
+        
+        if simulation is not None:
+            plan_result["retirement_simulation"] = _simulate(full_user_data, plan_result, simulation)
+        plan_cache.put(cache_key, plan_result)
+    return plan_result
+
+def _normalize_risk_answer(answer):
+    """与核心计算保持一致: 风险问题答案不区分大小写"""
+    return answer.upper() if isinstance(answer, str) else answer
+
+def _not_modified(etag):
+    """返回带 ETag 的 304 响应"""
+    response = app.response_class(status=304)
+    response.set_etag(etag, weak=True)
+    response.vary.add('Accept')
+    return response
+
+def _single_plan_format(cache_key):
+    """按 Accept 协商单个规划的响应格式，返回 (mimetype, 该格式的 ETag)"""
+    mimetype = plan_formats.negotiate(request.accept_mimetypes, plan_formats.single_plan_mimetypes())
+    if mimetype == plan_formats.MSGPACK_MIMETYPE:
+        return mimetype, f"{cache_key}-msgpack"
+    return mimetype, cache_key
+
+def _single_plan_response(payload, mimetype, status=200):
+    """以 JSON 或 MessagePack 返回单个规划（payload["data"] 为规划结果）"""
+    if mimetype == plan_formats.MSGPACK_MIMETYPE:
+        payload = dict(payload, data=plan_formats.plan_record(payload["data"]))
+        response = app.response_class(plan_formats.pack_msgpack(payload), status=status, mimetype=mimetype)
+    else:
+        response = jsonify(payload)
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
 
 @app.route('/')
 def index():
@@ -26,61 +134,61 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     })
 
+@app.route('/api/cache/stats')
+def cache_stats():
+    """规划缓存命中统计"""
+    return jsonify(plan_cache.stats())
+
 @app.route('/api/plan', methods=['POST'])
+@profiling.profiled
 def generate_plan():
     """生成养老规划API"""
     try:
-        # 获取用户数据
+        # 获取并验证用户数据
         user_data = request.get_json()
+        try:
+            full_user_data = validate_plan_input(user_data)
+        except PlanInputError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e)
+            }), 400
         
-        # 验证必需字段
-        required_fields = ['age', 'annual_income', 'current_assets', 'monthly_expenses', 'retirement_age']
-        for field in required_fields:
-            if field not in user_data:
+        # 可选: 蒙特卡洛模拟养老资金充足概率（Web 请求内不启用进程池）
+        simulation = None
+        if user_data.get('simulate'):
+            try:
+                simulation_paths = int(user_data.get('simulation_paths', 10000))
+                seed = user_data.get('seed')
+                seed = int(seed) if seed is not None else None
+            except (TypeError, ValueError):
                 return jsonify({
                     "success": False,
-                    "error": f"缺少必需字段: {field}"
+                    "error": "请输入有效的数字"
                 }), 400
-        
-        # 验证数字字段
-        try:
-            age = int(user_data['age'])
-            annual_income = int(user_data['annual_income'])
-            current_assets = int(user_data['current_assets'])
-            monthly_expenses = int(user_data['monthly_expenses'])
-            retirement_age = int(user_data['retirement_age'])
-            
-            if retirement_age <= age:
+            if not 0 < simulation_paths <= MAX_SIMULATION_PATHS:
                 return jsonify({
                     "success": False,
-                    "error": "退休年龄必须大于当前年龄"
+                    "error": f"模拟路径数必须在 1 到 {MAX_SIMULATION_PATHS} 之间"
                 }), 400
-                
-        except ValueError:
-            return jsonify({
-                "success": False,
-                "error": "请输入有效的数字"
-            }), 400
+            simulation = {"paths": simulation_paths, "seed": seed}
         
-        # 准备完整用户数据
-        full_user_data = {
-            'age': age,
-            'annual_income': annual_income,
-            'current_assets': current_assets,
-            'monthly_expenses': monthly_expenses,
-            'retirement_age': retirement_age,
-            'risk_q1': user_data.get('risk_q1', 'B'),
-            'risk_q2': user_data.get('risk_q2', 'B'),
-            'risk_q3': user_data.get('risk_q3', 'B')
-        }
+        # 客户端携带相同 ETag 时直接返回 304；未指定随机种子的模拟结果每次不同，不使用 ETag
+        cache_key = _plan_cache_key(full_user_data, simulation)
+        deterministic = simulation is None or simulation["seed"] is not None
+        mimetype, etag = _single_plan_format(cache_key)
+        if deterministic and request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
         
-        # 生成规划
-        plan_result = advisor.generate_comprehensive_plan(full_user_data)
+        plan_result = _cached_plan(cache_key, full_user_data, simulation)
         
-        return jsonify({
+        response = _single_plan_response({
             "success": True,
             "data": plan_result
-        })
+        }, mimetype)
+        if deterministic:
+            response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
         return jsonify({
@@ -88,7 +196,311 @@ def generate_plan():
             "error": f"生成规划时出错: {str(e)}"
         }), 500
 
+def _session_response(session_id, session, status=200):
+    """返回会话的当前规划，ETag 随会话版本变化"""
+    mimetype, etag = _single_plan_format(f"{session_id}-{session.version}")
+    response = _single_plan_response({
+        "success": True,
+        "session": session_id,
+        "version": session.version,
+        "recomputed": session.last_recomputed,
+        "data": session.plan()
+    }, mimetype, status)
+    response.set_etag(etag, weak=True)
+    return response
+
+@app.route('/api/plan/session', methods=['POST'])
+def create_plan_session():
+    """创建增量规划会话，之后用 PATCH /api/plan/<session> 提交字段修改"""
+    try:
+        session = PlanSession(advisor, request.get_json(silent=True))
+    except PlanInputError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "error": f"生成规划时出错: {str(e)}"}), 500
+    
+    session_id = secrets.token_urlsafe(16)
+    plan_sessions.create(session_id, session.state())
+    return _session_response(session_id, session, 201)
+
+def _load_session(session_id):
+    state = plan_sessions.get(session_id)
+    return None if state is None else PlanSession.from_state(advisor, state)
+
+@app.route('/api/plan/<session_id>', methods=['GET', 'PATCH', 'DELETE'])
+def plan_session(session_id):
+    """查看、增量修改或删除规划会话
+
+    PATCH 请求体为字段修改，例如 {"retirement_age": 62}；只重算受影响的阶段，
+    响应的 recomputed 列出本次重算的阶段。
+    """
+    if request.method == 'DELETE':
+        if not plan_sessions.discard(session_id):
+            return jsonify({"success": False, "error": "规划会话不存在或已过期"}), 404
+        return jsonify({"success": True})
+    
+    session = _load_session(session_id)
+    if session is None:
+        return jsonify({"success": False, "error": "规划会话不存在或已过期"}), 404
+    
+    if request.method == 'PATCH':
+        delta = request.get_json(silent=True)
+        for _ in range(PLAN_SESSION_UPDATE_ATTEMPTS):
+            base_version = session.version
+            try:
+                session.update(delta)
+            except PlanInputError as e:
+                return jsonify({"success": False, "error": str(e)}), 400
+            except Exception as e:
+                return jsonify({"success": False, "error": f"生成规划时出错: {str(e)}"}), 500
+            # 写回同时刷新过期时间；期间会话被其他请求修改过时，基于最新状态重新应用本次修改
+            if plan_sessions.replace(session_id, session.state(), base_version):
+                break
+            session = _load_session(session_id)
+            if session is None:
+                return jsonify({"success": False, "error": "规划会话不存在或已过期"}), 404
+        else:
+            return jsonify({"success": False, "error": "规划会话正被同时修改，请稍后重试"}), 409
+    else:
+        _, etag = _single_plan_format(f"{session_id}-{session.version}")
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+    
+    return _session_response(session_id, session)
+
+@app.route('/api/plan/stream', methods=['POST'])
+def generate_plan_stream():
+    """NDJSON 流式批量规划API
+
+    请求体每行一个用户数据 JSON 对象，按 /api/plan 的规则逐行验证；
+    响应同样为 NDJSON，每行输出一个规划结果或该行的错误信息，
+    边读边算边写，内存占用与输入大小无关。
+    """
+    stream = request.stream
+    
+    def generate():
+        line_number = 0
+        while True:
+            raw_line = stream.readline(MAX_NDJSON_LINE_BYTES + 1)
+            if not raw_line:
+                break
+            line_number += 1
+            
+            if len(raw_line) > MAX_NDJSON_LINE_BYTES and not raw_line.endswith(b'\n'):
+                # 丢弃超长行的剩余部分
+                while raw_line and not raw_line.endswith(b'\n'):
+                    raw_line = stream.readline(MAX_NDJSON_LINE_BYTES)
+                result = {"line": line_number, "success": False, "error": "单行数据过长"}
+                yield app.json.dumps(result) + '\n'
+                continue
+            
+            if not raw_line.strip():
+                continue
+            
+            try:
+                full_user_data = validate_plan_input(json.loads(raw_line))
+                plan_result = _cached_plan(_plan_cache_key(full_user_data), full_user_data)
+                result = {"line": line_number, "success": True, "data": plan_result}
+            except PlanInputError as e:
+                result = {"line": line_number, "success": False, "error": str(e)}
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                result = {"line": line_number, "success": False, "error": "无效的 JSON 数据"}
+            except Exception as e:
+                result = {"line": line_number, "success": False, "error": f"生成规划时出错: {str(e)}"}
+            yield app.json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/plan/sse', methods=['GET', 'POST'])
+def generate_plan_sse():
+    """Server-Sent Events 流式规划API
+
+    先立即推送确定性部分（event: plan，含档案、养老需求、资产配置和产品推荐），
+    再逐段推送AI建议（event: advice），最后推送 event: done。
+    GET 请求从查询参数读取用户数据，便于浏览器 EventSource 直接使用。
+    """
+    user_data = request.get_json(silent=True) if request.method == 'POST' else request.args.to_dict()
+    try:
+        full_user_data = validate_plan_input(user_data)
+    except PlanInputError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 400
+    
+    def sse(event, payload):
+        return f"event: {event}\ndata: {app.json.dumps(payload)}\n\n"
+    
+    def generate():
+        try:
+            allocation, risk_type = advisor.generate_portfolio_allocation(full_user_data)
+            retirement_data = advisor.calculate_retirement_needs(full_user_data)
+            yield sse("plan", {
+                "user_profile": {
+                    "age": full_user_data['age'],
+                    "annual_income": full_user_data['annual_income'],
+                    "current_assets": full_user_data['current_assets'],
+                    "monthly_expenses": full_user_data['monthly_expenses'],
+                    "retirement_age": full_user_data['retirement_age'],
+                    "risk_profile": risk_type
+                },
+                "retirement_analysis": retirement_data,
+                "portfolio_allocation": allocation,
+                "product_recommendations": advisor.get_product_recommendations(allocation, risk_type)
+            })
+            for text in advisor.stream_ai_advice(full_user_data, allocation, risk_type, retirement_data):
+                yield sse("advice", {"text": text})
+            yield sse("done", {"generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+        except Exception as e:
+            yield sse("error", {"error": f"生成规划时出错: {str(e)}"})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _masked_list(values, invalid):
+    """数值列转为列表，invalid 标记的行为 null"""
+    if invalid is None:
+        return values.tolist()
+    values = values.astype(object)
+    values[invalid] = None
+    return values.tolist()
+
+@app.route('/api/plan/batch', methods=['POST'])
+@profiling.profiled
+def generate_batch_plan():
+    """批量生成养老规划API（列式输入: {字段: [值, ...]}）
+
+    默认返回列式 JSON；Accept 为 Arrow IPC 流或 Parquet 时按 plan_formats.BATCH_COLUMNS 的固定列布局返回。
+    无效的行不影响其他行: valid 标记各行是否有效，errors 列出无效行的下标（从 0 开始）和错误信息，
+    无效行的结果为 null。
+    """
+    try:
+        columns = request.get_json()
+        if not isinstance(columns, dict):
+            return jsonify({"success": False, "error": "请求体必须是列式 JSON 对象"}), 400
+
+        for field in BATCH_REQUIRED_FIELDS:
+            if not isinstance(columns.get(field), list):
+                return jsonify({
+                    "success": False,
+                    "error": f"缺少必需字段: {field}"
+                }), 400
+
+        try:
+            batch_result = advisor.generate_batch_plan(columns)
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        mimetype = plan_formats.negotiate(request.accept_mimetypes, plan_formats.batch_plan_mimetypes())
+        if mimetype != plan_formats.JSON_MIMETYPE:
+            table = plan_formats.batch_plan_table(batch_result)
+            response = app.response_class(plan_formats.serialize_table(table, mimetype), mimetype=mimetype)
+        else:
+            retirement_data = batch_result["retirement_analysis"]
+            invalid = ~batch_result["valid"] if batch_result["errors"] else None
+            response = jsonify({
+                "success": True,
+                "data": {
+                    "count": batch_result["count"],
+                    "valid": batch_result["valid"].tolist(),
+                    "errors": [{"row": row, "error": message} for row, message in batch_result["errors"]],
+                    "risk_profile": batch_result["risk_profile"].tolist(),
+                    "risk_score": _masked_list(batch_result["risk_score"], invalid),
+                    "retirement_analysis": {
+                        key: _masked_list(value, invalid) for key, value in retirement_data.items()
+                    },
+                    "portfolio_allocation": {
+                        key: _masked_list(value, invalid) for key, value in batch_result["portfolio_allocation"].items()
+                    },
+                    "generated_at": batch_result["generated_at"]
+                }
+            })
+        response.vary.add('Accept')
+        return response
+
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": f"批量生成规划时出错: {str(e)}"
+        }), 500
+
+@app.route('/api/glidepath', methods=['POST'])
+@profiling.profiled
+def generate_glidepath():
+    """下滑路径API: 从当前年龄到退休年龄逐年的资产配置（预先计算的下滑路径表的一段）"""
+    try:
+        user_data = request.get_json()
+        try:
+            full_user_data = validate_plan_input(user_data)
+        except PlanInputError as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        etag = plan_cache.make_key('glidepath', {
+            **full_user_data,
+            **{f'risk_q{i}': _normalize_risk_answer(full_user_data[f'risk_q{i}']) for i in range(1, 4)},
+            'assumptions': ASSUMPTIONS_VERSION
+        })
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
+
+        response = jsonify({"success": True, "data": advisor.generate_glidepath(full_user_data)})
+        response.set_etag(etag, weak=True)
+        # 与 304 响应保持一致，共享缓存按 Accept 区分
+        response.vary.add('Accept')
+        return response
+
+    except Exception as e:
+        return jsonify({"success": False, "error": f"生成下滑路径时出错: {str(e)}"}), 500
+
+@app.route('/api/glidepath/batch', methods=['POST'])
+@profiling.profiled
+def generate_glidepath_batch():
+    """批量下滑路径API（列式输入: {字段: [值, ...]}）
+
+    默认返回 JSON，每个资产类别一个 [客户][年份] 的嵌套列表；Accept 为 Arrow IPC 流或 Parquet 时
+    返回 plan_formats.glidepath_table 的列表列布局。
+    """
+    try:
+        columns = request.get_json()
+        if not isinstance(columns, dict):
+            return jsonify({"success": False, "error": "请求体必须是列式 JSON 对象"}), 400
+
+        for field in BATCH_REQUIRED_FIELDS:
+            if not isinstance(columns.get(field), list):
+                return jsonify({"success": False, "error": f"缺少必需字段: {field}"}), 400
+
+        try:
+            result = advisor.generate_glidepath_batch(columns)
+        except (TypeError, ValueError) as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+        mimetype = plan_formats.negotiate(request.accept_mimetypes, plan_formats.batch_plan_mimetypes())
+        if mimetype != plan_formats.JSON_MIMETYPE:
+            table = plan_formats.glidepath_table(result)
+            response = app.response_class(plan_formats.serialize_table(table, mimetype), mimetype=mimetype)
+        else:
+            length = result["length"].tolist()
+            allocation = np.round(result["allocation"].astype(np.float64), 2)
+            response = jsonify({
+                "success": True,
+                "data": {
+                    "count": len(length),
+                    "risk_profile": [RISK_TYPES[i] for i in result["risk_index"].tolist()],
+                    "length": length,
+                    "allocation": {
+                        category: [path[:n] for path, n in zip(allocation[:, :, i].tolist(), length)]
+                        for i, category in enumerate(ASSET_CLASSES)
+                    }
+                }
+            })
+        response.vary.add('Accept')
+        return response
+
+    except Exception as e:
+        return jsonify({"success": False, "error": f"批量生成下滑路径时出错: {str(e)}"}), 500
+
 @app.route('/api/simple_plan', methods=['POST'])
+@profiling.profiled
 def generate_simple_plan():
     """简化版规划生成（不依赖AI模型）"""
     try:
@@ -111,47 +523,63 @@ def generate_simple_plan():
         if retirement_age <= age:
             return jsonify({"success": False, "error": "退休年龄必须大于当前年龄"}), 400
         
-        # 简化计算逻辑
-        years_to_retire = retirement_age - age
-        annual_expenses = expenses * 12
-        total_needed = annual_expenses * 25  # 简单估算
-        monthly_savings = total_needed // (years_to_retire * 12)
-        
-        # 资产配置
-        if risk_profile == 'conservative':
-            allocation = {"股票": 20, "债券": 50, "现金": 30}
-            risk_name = "保守型"
-        elif risk_profile == 'moderate':
-            allocation = {"股票": 50, "债券": 40, "现金": 10}
-            risk_name = "稳健型"
-        else:
-            allocation = {"股票": 70, "债券": 25, "现金": 5}
-            risk_name = "进取型"
-        
-        # 调整年龄因素
-        if age > 50:
-            allocation["股票"] = max(10, allocation["股票"] - 10)
-            allocation["债券"] += 10
+        # 按规范化输入查缓存（未识别的风险偏好都按进取型处理）
+        risk_key = risk_profile if risk_profile in ('conservative', 'moderate') else 'aggressive'
+        cache_key = plan_cache.make_key('simple_plan', {
+            'age': age, 'annual_income': income, 'current_assets': assets,
+            'monthly_expenses': expenses, 'retirement_age': retirement_age, 'risk_profile': risk_key
+        })
+        if request.if_none_match.contains_weak(cache_key):
+            return _not_modified(cache_key)
         
-        result = {
-            "user_profile": {
-                "age": age,
-                "annual_income": income,
-                "current_assets": assets,
-                "monthly_expenses": expenses,
-                "retirement_age": retirement_age,
-                "risk_profile": risk_name
-            },
-            "retirement_analysis": {
-                "years_to_retire": years_to_retire,
-                "total_needed": total_needed,
-                "monthly_savings": monthly_savings
-            },
-            "portfolio_allocation": allocation,
-            "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
+        result = plan_cache.get(cache_key)
+        if result is None:
+            # 简化计算逻辑
+            years_to_retire = retirement_age - age
+            annual_expenses = expenses * 12
+            total_needed = annual_expenses * 25  # 简单估算
+            monthly_savings = total_needed // (years_to_retire * 12)
+            
+            # 资产配置
+            if risk_profile == 'conservative':
+                allocation = {"股票": 20, "债券": 50, "现金": 30}
+                risk_name = "保守型"
+            elif risk_profile == 'moderate':
+                allocation = {"股票": 50, "债券": 40, "现金": 10}
+                risk_name = "稳健型"
+            else:
+                allocation = {"股票": 70, "债券": 25, "现金": 5}
+                risk_name = "进取型"
+            
+            # 调整年龄因素
+            if age > 50:
+                allocation["股票"] = max(10, allocation["股票"] - 10)
+                allocation["债券"] += 10
+            
+            result = {
+                "user_profile": {
+                    "age": age,
+                    "annual_income": income,
+                    "current_assets": assets,
+                    "monthly_expenses": expenses,
+                    "retirement_age": retirement_age,
+                    "risk_profile": risk_name
+                },
+                "retirement_analysis": {
+                    "years_to_retire": years_to_retire,
+                    "total_needed": total_needed,
+                    "monthly_savings": monthly_savings
+                },
+                "portfolio_allocation": allocation,
+                "generated_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            plan_cache.put(cache_key, result)
         
-        return jsonify({"success": True, "data": result})
+        response = jsonify({"success": True, "data": result})
+        response.set_etag(cache_key, weak=True)
+        # 与 304 响应保持一致，共享缓存按 Accept 区分
+        response.vary.add('Accept')
+        return response
         
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
@@ -0,0 +1,395 @@
+# batch_plan.py - 离线批量养老规划命令行工具
+#
+# 用法:
+#   python batch_plan.py clients.csv plans.jsonl --workers 8
+#   python batch_plan.py clients.jsonl plans.csv --chunk-size 10000
+#   python batch_plan.py clients.bin plans.csv      # client_store.py 生成的定长档案库
+#
+# 输入为 CSV（表头为字段名）、JSONL（每行一个 JSON 对象）或定长档案库（.bin），
+# 按块分发到进程池，结果按输入顺序写出。每写完一块就更新检查点，中断后重新运行同一命令即可续跑。
+# 档案库输入不经过主进程解析和进程间传递：各工作进程映射同一文件，只接收行号范围。
+#
+# 增量模式（--state，仅限档案库输入）:
+#   python batch_plan.py clients.bin changed_plans.csv --state plans.state
+# 状态文件记录每个客户上次规划时的输入内容哈希（含假设版本号）和年龄，本次只重新规划
+# 新增、资料变化或年龄变化（含跨越年龄段）的客户，输出中带 client_id 列；全部完成后才更新状态文件。
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from advisor_core import PensionAdvisorCore, PlanInputError, validate_plan_input, ASSET_CLASSES, AGE_BAND_LIMITS
+from client_store import ClientStore
+
+# CSV 输出的固定列
+CSV_COLUMNS = (
+    ["row", "success", "error",
+     "age", "annual_income", "current_assets", "monthly_expenses", "retirement_age", "risk_profile",
+     "years_to_retire", "annual_expenses", "total_retirement_needed", "monthly_savings_needed"]
+    + list(ASSET_CLASSES)
+    + ["generated_at"]
+)
+
+# 增量模式状态文件的记录布局（按 client_id 排序）
+STATE_DTYPE = np.dtype([("client_id", "<i8"), ("fingerprint", "<u8"), ("age", "<i8")])
+
+_worker_advisor = None
+_worker_store = None
+
+
+def _init_worker(store_path=None):
+    """进程池初始化：每个工作进程只创建一次核心对象，档案库输入时映射一次档案库"""
+    global _worker_advisor, _worker_store
+    _worker_advisor = PensionAdvisorCore()
+    if store_path is not None:
+        _worker_store = ClientStore(store_path)
+
+
+def _plan_row(advisor, row_number, record):
+    """为单行输入生成规划，返回 {row, success, data/error}"""
+    if isinstance(record, PlanInputError):
+        return {"row": row_number, "success": False, "error": str(record)}
+    try:
+        full_user_data = validate_plan_input(record)
+        return {"row": row_number, "success": True, "data": advisor.generate_comprehensive_plan(full_user_data)}
+    except PlanInputError as e:
+        return {"row": row_number, "success": False, "error": str(e)}
+    except Exception as e:
+        return {"row": row_number, "success": False, "error": f"生成规划时出错: {str(e)}"}
+
+
+def _to_csv_row(result):
+    """把规划结果展开为 CSV_COLUMNS 对应的一行"""
+    row = {"row": result["row"], "success": result["success"], "error": result.get("error", "")}
+    data = result.get("data")
+    if data:
+        row.update(data["user_profile"])
+        row.update(data["retirement_analysis"])
+        row.update(data["portfolio_allocation"])
+        row["generated_at"] = data["generated_at"]
+    return [row.get(column, "") for column in CSV_COLUMNS]
+
+
+def plan_chunk(first_row, records, output_format):
+    """工作进程入口：规划一块数据并直接序列化为输出文本"""
+    advisor = _worker_advisor or PensionAdvisorCore()
+    results = [_plan_row(advisor, first_row + i, record) for i, record in enumerate(records)]
+    if output_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(_to_csv_row(result) for result in results)
+        return buffer.getvalue()
+    return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+
+
+def _batch_csv_rows(row_numbers, batch_result, client_ids=None):
+    """把列式批量规划结果展开为 CSV_COLUMNS 对应的各行（给出 client_ids 时加在最前）"""
+    n = batch_result["count"]
+    columns = {
+        "client_id": client_ids,
+        "row": row_numbers,
+        "success": itertools.repeat(True, n),
+        "error": itertools.repeat("", n),
+        "risk_profile": batch_result["risk_profile"].tolist(),
+        "generated_at": itertools.repeat(batch_result["generated_at"], n),
+    }
+    for group in ("user_profile", "retirement_analysis", "portfolio_allocation"):
+        columns.update({key: values.tolist() for key, values in batch_result[group].items()})
+    output_columns = CSV_COLUMNS if client_ids is None else ["client_id"] + CSV_COLUMNS
+    rows = zip(*(columns[column] for column in output_columns))
+    if not batch_result["errors"]:
+        return rows
+
+    # 无效行与逐行规划的失败行格式相同: 只有行号、失败标记和错误信息
+    failed = dict(batch_result["errors"])
+    head = output_columns.index("success")
+    blank = ("",) * (len(output_columns) - head - 2)
+    return (row[:head] + (False, failed[i]) + blank if i in failed else row for i, row in enumerate(rows))
+
+
+def plan_store_chunk(rows, output_format, include_client_id=False, store_path=None):
+    """工作进程入口：直接在档案库的 mmap 视图上规划
+
+    rows 为连续行范围 (start, stop) 或行下标数组（增量模式）。
+    CSV 输出只含数值结果，整块使用列式批量规划；JSONL 输出需要产品推荐和建议，逐行生成。
+    """
+    advisor = _worker_advisor or PensionAdvisorCore()
+    store = _worker_store or ClientStore(store_path)
+    if isinstance(rows, tuple):
+        book = store.book(*rows)
+        row_numbers = list(range(rows[0] + 1, rows[1] + 1))
+        client_ids = store.client_ids[rows[0]:rows[1]].tolist() if include_client_id else None
+    else:
+        book = store.select(rows)
+        row_numbers = (rows + 1).tolist()
+        client_ids = store.client_ids[rows].tolist() if include_client_id else None
+
+    if output_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(_batch_csv_rows(row_numbers, advisor.generate_batch_plan(book), client_ids))
+        return buffer.getvalue()
+    results = []
+    for i, row_number in enumerate(row_numbers):
+        # 与逐行输入的 _plan_row 一致: 单行出错只记录该行，不中断整块
+        try:
+            result = {"row": row_number, "success": True, "data": advisor.generate_comprehensive_plan(book.profile(i))}
+        except Exception as e:
+            result = {"row": row_number, "success": False, "error": f"生成规划时出错: {str(e)}"}
+        if client_ids is not None:
+            result = {"client_id": client_ids[i], **result}
+        results.append(result)
+    return "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in results)
+
+
+def read_records(path, input_format):
+    """逐行读取输入文件，无法解析的行以 PlanInputError 占位，保证行号对齐"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if input_format == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield PlanInputError("无效的 JSON 数据")
+
+
+def load_state(path):
+    """读取增量模式状态文件，不存在时返回空状态"""
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=STATE_DTYPE)
+    with open(path, "rb") as f:
+        state = np.load(f, allow_pickle=False)
+    if state.dtype != STATE_DTYPE:
+        raise SystemExit(f"状态文件 {path} 格式不正确")
+    return state
+
+
+def save_state(path, state):
+    """原子地写入状态文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, state, allow_pickle=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def select_changed(store, state):
+    """比较档案库与上次的状态，返回 (需要重新规划的行下标, 新状态, 分类统计)
+
+    资料哈希不含年龄：年龄变化同样需要重新规划（距退休年数随之变化），
+    其中跨越配置年龄段（AGE_BAND_LIMITS）的客户单独统计，因为他们的资产配置也会改变。
+    """
+    client_ids = np.array(store.client_ids)
+    book = store.book()
+    fingerprint = book.fingerprint()
+    age = np.array(book.age)
+
+    order = np.argsort(client_ids, kind="stable")
+    if len(order) > 1 and np.any(client_ids[order][1:] == client_ids[order][:-1]):
+        raise SystemExit("档案库中存在重复的 client_id，无法增量规划")
+
+    if len(state):
+        position = np.minimum(np.searchsorted(state["client_id"], client_ids), len(state) - 1)
+        previous = state[position]
+        found = previous["client_id"] == client_ids
+    else:
+        previous = np.zeros(len(client_ids), dtype=STATE_DTYPE)
+        found = np.zeros(len(client_ids), dtype=bool)
+
+    changed = found & (previous["fingerprint"] != fingerprint)
+    aged = found & ~changed & (previous["age"] != age)
+    band_crossed = aged & (np.searchsorted(AGE_BAND_LIMITS, previous["age"], side="right")
+                           != np.searchsorted(AGE_BAND_LIMITS, age, side="right"))
+    replan = ~found | changed | aged
+
+    new_state = np.empty(len(client_ids), dtype=STATE_DTYPE)
+    new_state["client_id"] = client_ids[order]
+    new_state["fingerprint"] = fingerprint[order]
+    new_state["age"] = age[order]
+
+    summary = {
+        "total": len(client_ids),
+        "new": int((~found).sum()),
+        "changed": int(changed.sum()),
+        "aged": int(aged.sum()),
+        "band_crossed": int(band_crossed.sum()),
+        "unchanged": int((~replan).sum()),
+        "removed": len(state) - int(found.sum()),
+    }
+    return np.flatnonzero(replan), new_state, summary
+
+
+def _detect_format(path, explicit, output=False):
+    """按显式参数或扩展名判断文件格式；档案库（.bin）只能作为输入"""
+    if explicit:
+        return explicit
+    if path.lower().endswith(".bin"):
+        if output:
+            raise SystemExit(f"档案库格式只能用于输入，请为输出文件 {path} 使用 .csv/.jsonl 扩展名或 --output-format")
+        return "store"
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def _load_checkpoint(checkpoint_path, args, input_format, output_format):
+    """读取检查点，与本次运行参数不一致时拒绝续跑"""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    expected = {
+        "input": os.path.abspath(args.input),
+        "input_format": input_format,
+        "output_format": output_format,
+        "state": os.path.abspath(args.state) if args.state else None,
+    }
+    for key, value in expected.items():
+        if checkpoint.get(key) != value:
+            raise SystemExit(f"检查点 {checkpoint_path} 与本次运行参数不一致（{key}），请删除后重新运行")
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_path, checkpoint):
+    """原子地写入检查点"""
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, checkpoint_path)
+
+
+def run(args):
+    input_format = _detect_format(args.input, args.input_format)
+    output_format = _detect_format(args.output, args.output_format, output=True)
+    if args.state and input_format != "store":
+        raise SystemExit("增量模式（--state）需要档案库输入，请先用 client_store.py 转换")
+    checkpoint_path = args.checkpoint or args.output + ".checkpoint"
+
+    checkpoint = _load_checkpoint(checkpoint_path, args, input_format, output_format)
+    rows_done = checkpoint["rows_done"] if checkpoint else 0
+
+    if checkpoint:
+        # 截掉上次崩溃时可能写了一半的数据，从检查点位置继续追加
+        output = open(args.output, "r+b")
+        output.truncate(checkpoint["output_bytes"])
+        output.seek(checkpoint["output_bytes"])
+        print(f"从检查点续跑: 已完成 {rows_done} 行", file=sys.stderr)
+    else:
+        output = open(args.output, "wb")
+        if output_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(["client_id"] + CSV_COLUMNS if args.state else CSV_COLUMNS)
+            output.write(buffer.getvalue().encode("utf-8"))
+        checkpoint = {
+            "input": os.path.abspath(args.input),
+            "input_format": input_format,
+            "output_format": output_format,
+            "state": os.path.abspath(args.state) if args.state else None,
+            "rows_done": 0,
+            "output_bytes": output.tell(),
+        }
+
+    started = time.perf_counter()
+    processed = 0
+    max_pending = args.workers * 2
+
+    new_state = None
+    if input_format == "store":
+        store_path = os.path.abspath(args.input)
+        with ClientStore(store_path) as store:
+            total_rows = len(store)
+            if args.state:
+                selected, new_state, summary = select_changed(store, load_state(args.state))
+                print("增量规划: " + "，".join(f"{key} {value}" for key, value in summary.items()), file=sys.stderr)
+
+        if args.state:
+            def chunks():
+                # 续跑时状态文件尚未更新，重新选出的行与上次相同
+                for start in range(rows_done, len(selected), args.chunk_size):
+                    rows = selected[start:start + args.chunk_size]
+                    yield len(rows), (plan_store_chunk, rows, output_format, True)
+        else:
+            def chunks():
+                # 只传行号范围，工作进程从各自的映射中读取数据
+                for start in range(rows_done, total_rows, args.chunk_size):
+                    stop = min(start + args.chunk_size, total_rows)
+                    yield stop - start, (plan_store_chunk, (start, stop), output_format)
+    else:
+        store_path = None
+        records = itertools.islice(read_records(args.input, input_format), rows_done, None)
+
+        def chunks():
+            first_row = rows_done + 1
+            while True:
+                chunk = list(itertools.islice(records, args.chunk_size))
+                if not chunk:
+                    return
+                yield len(chunk), (plan_chunk, first_row, chunk, output_format)
+                first_row += len(chunk)
+
+    with output, ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                     initargs=(store_path,)) as pool:
+        # 限制在途块数，避免一次性把整个输入读进内存；按提交顺序取结果以保证输出有序
+        pending = deque()
+        chunk_iter = chunks()
+        while True:
+            while len(pending) < max_pending:
+                next_chunk = next(chunk_iter, None)
+                if next_chunk is None:
+                    break
+                size, task = next_chunk
+                pending.append((size, pool.submit(*task)))
+            if not pending:
+                break
+
+            size, future = pending.popleft()
+            output.write(future.result().encode("utf-8"))
+            output.flush()
+            os.fsync(output.fileno())
+
+            processed += size
+            checkpoint["rows_done"] += size
+            checkpoint["output_bytes"] = output.tell()
+            _save_checkpoint(checkpoint_path, checkpoint)
+
+            elapsed = time.perf_counter() - started
+            print(f"已完成 {checkpoint['rows_done']} 行，{processed / elapsed:,.0f} 行/秒", file=sys.stderr)
+
+    os.remove(checkpoint_path)
+    if new_state is not None:
+        # 输出全部写完后才更新状态；在此之前中断，下次运行会重新规划同一批客户
+        save_state(args.state, new_state)
+    elapsed = time.perf_counter() - started
+    rate = processed / elapsed if elapsed else 0
+    print(f"✅ 完成: 本次处理 {processed} 行，用时 {elapsed:.1f} 秒，{rate:,.0f} 行/秒 -> {args.output}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线批量生成养老规划")
+    parser.add_argument("input", help="输入文件（.csv、.jsonl 或定长档案库 .bin）")
+    parser.add_argument("output", help="输出文件（.jsonl 或 .csv）")
+    parser.add_argument("--input-format", choices=["csv", "jsonl", "store"], help="输入格式，默认按扩展名判断")
+    parser.add_argument("--output-format", choices=["csv", "jsonl"], help="输出格式，默认按扩展名判断")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="每块行数")
+    parser.add_argument("--checkpoint", help="检查点文件路径，默认为 <output>.checkpoint")
+    parser.add_argument("--state", help="增量模式状态文件：只重新规划新增或变化的客户（需要档案库输入）")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers 和 --chunk-size 必须为正整数")
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# benchmark.py - 性能基准测试
+#
+# 三组基准：
+#   core  - PensionAdvisorCore 各方法的微基准
+#   http  - 通过 Flask 测试客户端对 /api/plan、/api/simple_plan 做端到端吞吐测试
+#   llm   - 使用桩模型测 ImprovedPensionAdvisor.generate_comprehensive_report
+#
+# 用法:
+#   python benchmark.py --save benchmark_baseline.json          # 记录基线
+#   python benchmark.py --compare benchmark_baseline.json       # 与基线比较，退化超过阈值时退出码为 1
+#   python benchmark.py --compare benchmark_baseline.json --threshold 0.3 --case-threshold simulate_retirement=0.5
+#   python benchmark.py --groups core,http --quick
+import argparse
+from datetime import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+
+SAMPLE_USER = {
+    'age': 35,
+    'annual_income': 200000,
+    'current_assets': 600000,
+    'monthly_expenses': 8000,
+    'retirement_age': 60,
+    'risk_q1': 'B',
+    'risk_q2': 'C',
+    'risk_q3': 'B'
+}
+
+STUB_ADVICE = "<think>\n分析用户情况。\n</think>\n\n该配置股债均衡，建议坚持定投并每半年再平衡，注意市场波动风险。"
+
+
+class StubLLM:
+    """桩模型：固定回复，可设置模拟延迟"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def invoke(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return STUB_ADVICE
+
+    def stream(self, prompt):
+        yield self.invoke(prompt)
+
+
+def measure(func, min_time=0.2, repeat=5):
+    """自动确定每轮调用次数，返回单次调用耗时的统计（微秒）"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time / repeat or number >= 1 << 20:
+            break
+        number *= 2 if elapsed > min_time / repeat / 10 else 10
+
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) / number * 1e6)
+
+    median = statistics.median(samples)
+    return {
+        "median_us": round(median, 3),
+        "best_us": round(min(samples), 3),
+        "ops_per_sec": round(1e6 / median, 1) if median else None,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def core_cases():
+    from advisor_core import PensionAdvisorCore
+
+    advisor = PensionAdvisorCore(use_ai=False)
+    allocation, risk_type = advisor.generate_portfolio_allocation(SAMPLE_USER)
+    retirement_data = advisor.calculate_retirement_needs(SAMPLE_USER)
+    batch_rows = 10000
+    columns = {field: [value] * batch_rows for field, value in SAMPLE_USER.items()}
+    columns['age'] = [20 + i % 40 for i in range(batch_rows)]
+
+    return {
+        "calculate_retirement_needs": lambda: advisor.calculate_retirement_needs(SAMPLE_USER),
+        "calculate_risk_profile": lambda: advisor.calculate_risk_profile(SAMPLE_USER),
+        "generate_portfolio_allocation": lambda: advisor.generate_portfolio_allocation(SAMPLE_USER),
+        "get_product_recommendations": lambda: advisor.get_product_recommendations(allocation, risk_type),
+        "generate_ai_advice": lambda: advisor.generate_ai_advice(SAMPLE_USER, allocation, risk_type, retirement_data),
+        "generate_comprehensive_plan": lambda: advisor.generate_comprehensive_plan(SAMPLE_USER),
+        "simulate_retirement_10k": lambda: advisor.simulate_retirement(SAMPLE_USER, allocation, seed=1, processes=1),
+        "generate_batch_plan_10k": lambda: advisor.generate_batch_plan(columns),
+    }
+
+
+def http_cases():
+    import app as web
+
+    client = web.app.test_client()
+    simple_body = dict(SAMPLE_USER, risk_profile='moderate')
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} 返回 {response.status_code}: {response.get_data(as_text=True)}")
+
+    def uncached(path, body):
+        # 每次使用不同的年收入，绕过规划缓存
+        counter = iter(range(10 ** 9))
+        return lambda: post(path, dict(body, annual_income=body['annual_income'] + next(counter)))
+
+    return {
+        "api_plan": uncached('/api/plan', SAMPLE_USER),
+        "api_plan_cached": lambda: post('/api/plan', SAMPLE_USER),
+        "api_simple_plan": uncached('/api/simple_plan', simple_body),
+        "api_simple_plan_cached": lambda: post('/api/simple_plan', simple_body),
+    }
+
+
+def llm_cases(latency=0.0):
+    from pension_advisor_improved import ImprovedPensionAdvisor
+
+    advisor = ImprovedPensionAdvisor(load_model=False, warm_up=False)
+    advisor.llm = StubLLM(latency)
+    advisor.user_profile = {
+        'age': '35', 'income': '200000', 'assets': '600000', 'expenses': '8000', 'retirement_age': '60',
+        'risk_q1': 'B', 'risk_q2': 'C', 'risk_q3': 'B'
+    }
+
+    return {
+        "generate_comprehensive_report": advisor.generate_comprehensive_report,
+        "generate_comprehensive_report_stream": lambda: "".join(advisor.generate_comprehensive_report_stream()),
+    }
+
+
+GROUPS = {"core": core_cases, "http": http_cases, "llm": llm_cases}
+
+
+def run_benchmarks(groups, min_time=0.2, repeat=5, llm_latency=0.0):
+    results = {}
+    for group in groups:
+        cases = llm_cases(llm_latency) if group == "llm" else GROUPS[group]()
+        for name, func in cases.items():
+            key = f"{group}.{name}"
+            results[key] = measure(func, min_time=min_time, repeat=repeat)
+            print(f"{key:<50} {results[key]['median_us']:>12,.1f} µs  {results[key]['ops_per_sec'] or 0:>12,.1f} ops/s",
+                  file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold, case_thresholds):
+    """与基线比较，返回退化的用例列表"""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        limit = case_thresholds.get(key, case_thresholds.get(key.split(".", 1)[-1], threshold))
+        change = current["median_us"] / previous["median_us"] - 1
+        status = "退化" if change > limit else "正常"
+        print(f"{key:<50} {change:+8.1%}  (阈值 {limit:.0%})  {status}", file=sys.stderr)
+        if change > limit:
+            regressions.append({"case": key, "baseline_us": previous["median_us"],
+                                "current_us": current["median_us"], "change": round(change, 4)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="养老规划助手性能基准测试")
+    parser.add_argument("--groups", default="core,http,llm", help="逗号分隔的基准组: core,http,llm")
+    parser.add_argument("--save", help="把结果保存为 JSON 基线文件")
+    parser.add_argument("--compare", help="与 JSON 基线文件比较")
+    parser.add_argument("--threshold", type=float, default=0.2, help="默认退化阈值（0.2 表示慢 20%%）")
+    parser.add_argument("--case-threshold", action="append", default=[], metavar="CASE=RATIO",
+                        help="单个用例的阈值，可重复指定")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="桩模型每次调用的模拟延迟（秒）")
+    parser.add_argument("--quick", action="store_true", help="缩短测量时间（结果波动更大）")
+    args = parser.parse_args(argv)
+
+    groups = [group.strip() for group in args.groups.split(",") if group.strip()]
+    unknown = [group for group in groups if group not in GROUPS]
+    if unknown:
+        parser.error(f"未知的基准组: {', '.join(unknown)}")
+    case_thresholds = {}
+    for item in args.case_threshold:
+        name, _, ratio = item.partition("=")
+        case_thresholds[name] = float(ratio)
+
+    min_time, repeat = (0.05, 3) if args.quick else (0.2, 5)
+    results = run_benchmarks(groups, min_time=min_time, repeat=repeat, llm_latency=args.llm_latency)
+
+    report = {
+        "created_at": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.save}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, case_thresholds)
+        if regressions:
+            print(json.dumps({"regressions": regressions}, ensure_ascii=False, indent=2))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
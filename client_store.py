@@ -0,0 +1,207 @@
+# client_store.py - 定长二进制客户档案库（mmap 读取，零拷贝）
+#
+# 用法:
+#   python client_store.py clients.csv clients.bin     # 把 CSV/JSONL 客户档案转换为定长二进制格式
+#   python batch_plan.py clients.bin plans.csv         # 批量规划直接读取二进制档案库
+#
+# 文件格式（小端）:
+#   64 字节文件头: magic "PACLIENT"、格式版本 uint32、记录长度 uint32、记录数 uint64，其余为 0
+#   之后是 记录数 × RECORD_DTYPE 的定长记录
+# 读取时整个文件以只读方式 mmap，各字段是记录数组上的 NumPy 视图，不复制数据；
+# 数值字段均为 int64，可直接构造 ClientBook。多个工作进程映射同一文件时共享页缓存中的同一份数据。
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from advisor_core import BATCH_REQUIRED_FIELDS, ClientBook, PlanInputError, validate_plan_input
+
+STORE_MAGIC = b"PACLIENT"
+STORE_VERSION = 1
+HEADER_SIZE = 64
+_HEADER = struct.Struct("<8sIIQ")
+
+# 定长记录布局；risk_points 为三道风险问卷的得分（A=1, B=2, C=3）
+RECORD_DTYPE = np.dtype([
+    ("client_id", "<i8"),
+    ("age", "<i8"),
+    ("annual_income", "<i8"),
+    ("current_assets", "<i8"),
+    ("monthly_expenses", "<i8"),
+    ("retirement_age", "<i8"),
+    ("risk_points", "i1", (3,)),
+    ("_padding", "V5"),
+])
+
+# 转换时每次写入的记录数
+IMPORT_CHUNK_ROWS = 50000
+
+
+class ClientStoreError(ValueError):
+    """档案库文件格式错误"""
+
+
+class ClientStoreWriter:
+    """写入定长档案库；先写临时文件，close() 时回填记录数并原子地替换目标文件"""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._tmp_path = path + ".tmp"
+        self._file = open(self._tmp_path, "wb")
+        self._file.write(b"\0" * HEADER_SIZE)
+
+    def write_book(self, book, client_ids=None):
+        """追加一个 ClientBook；client_ids 缺省时按写入顺序从 1 开始编号"""
+        n = len(book)
+        records = np.zeros(n, dtype=RECORD_DTYPE)
+        if client_ids is None:
+            client_ids = np.arange(self.count + 1, self.count + n + 1)
+        records["client_id"] = client_ids
+        for field in BATCH_REQUIRED_FIELDS:
+            records[field] = getattr(book, field)
+        records["risk_points"] = book.risk_points
+        self._file.write(records.tobytes())
+        self.count += n
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(STORE_MAGIC, STORE_VERSION, RECORD_DTYPE.itemsize, self.count))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """放弃写入并删除临时文件"""
+        self._file.close()
+        os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ClientStore:
+    """只读 mmap 档案库，records 为整个文件上的结构化数组视图"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                raise ClientStoreError(f"{path} 不是客户档案库文件")
+            magic, version, record_size, count = _HEADER.unpack_from(header)
+            if magic != STORE_MAGIC:
+                raise ClientStoreError(f"{path} 不是客户档案库文件")
+            if version != STORE_VERSION or record_size != RECORD_DTYPE.itemsize:
+                raise ClientStoreError(f"{path} 的格式版本 {version} 不受支持")
+            if os.fstat(f.fileno()).st_size < HEADER_SIZE + count * record_size:
+                raise ClientStoreError(f"{path} 已截断")
+            # 映射建立后即可关闭文件描述符
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        self.records = (np.frombuffer(self._mmap, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+                        if count else np.zeros(0, dtype=RECORD_DTYPE))
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def client_ids(self):
+        return self.records["client_id"]
+
+    def book(self, start=0, stop=None):
+        """第 [start, stop) 条记录的 ClientBook，各列都是映射上的只读视图"""
+        records = self.records[start:stop]
+        return ClientBook(records["age"], records["annual_income"], records["current_assets"],
+                          records["monthly_expenses"], records["retirement_age"], records["risk_points"])
+
+    def select(self, indices):
+        """按行下标取出的 ClientBook（花式索引会复制所选行）"""
+        records = self.records[indices]
+        return ClientBook(records["age"], records["annual_income"], records["current_assets"],
+                          records["monthly_expenses"], records["retirement_age"], records["risk_points"])
+
+    def close(self):
+        self.records = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # 仍有视图在使用映射，交给垃圾回收在视图释放后关闭
+                pass
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def import_records(records, path):
+    """把 user_data 记录序列写成档案库，返回 (写入数, [(行号, 错误信息), ...])
+
+    每行按 validate_plan_input 验证，无效行跳过；记录中的 client_id 缺省时使用行号。
+    """
+    errors = []
+    columns = {field: [] for field in BATCH_REQUIRED_FIELDS + ("risk_q1", "risk_q2", "risk_q3", "client_id")}
+
+    def flush(writer):
+        if columns["client_id"]:
+            client_ids = np.asarray(columns.pop("client_id"), dtype=np.int64)
+            writer.write_book(ClientBook.from_columns(columns), client_ids)
+            for values in columns.values():
+                values.clear()
+            columns["client_id"] = []
+
+    with ClientStoreWriter(path) as writer:
+        for row_number, record in enumerate(records, 1):
+            try:
+                if isinstance(record, PlanInputError):
+                    raise record
+                full_user_data = validate_plan_input(record)
+                client_id = int(record.get("client_id") or row_number)
+            except (PlanInputError, TypeError, ValueError) as e:
+                errors.append((row_number, str(e)))
+                continue
+            for field, value in full_user_data.items():
+                columns[field].append(value)
+            columns["client_id"].append(client_id)
+            if len(columns["client_id"]) >= IMPORT_CHUNK_ROWS:
+                flush(writer)
+        flush(writer)
+        return writer.count, errors
+
+
+def main(argv=None):
+    import argparse
+    from batch_plan import _detect_format, read_records
+
+    parser = argparse.ArgumentParser(description="把客户档案转换为定长二进制档案库")
+    parser.add_argument("input", help="输入文件（.csv 或 .jsonl）")
+    parser.add_argument("output", help="输出的档案库文件")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="输入格式，默认按扩展名判断")
+    args = parser.parse_args(argv)
+
+    count, errors = import_records(read_records(args.input, _detect_format(args.input, args.input_format)),
+                                   args.output)
+    for row_number, error in errors[:20]:
+        print(f"第 {row_number} 行: {error}", file=sys.stderr)
+    if len(errors) > 20:
+        print(f"... 共 {len(errors)} 行无效", file=sys.stderr)
+    print(f"✅ 已写入 {count} 条记录 -> {args.output}（跳过 {len(errors)} 行）", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,17 @@
 # desktop_app.py - 完整的桌面版养老规划助手
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import math
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from advisor_core import PensionAdvisorCore, PlanInputError, validate_plan_input
+from report_renderer import ReportRenderer, report_context
+
+# 后台任务轮询间隔（毫秒）
+PLAN_POLL_INTERVAL_MS = 50
+# 按输入缓存的规划结果条数
+PLAN_CACHE_SIZE = 32
 
 class PensionAdvisorDesktop:
     def __init__(self, root):
@@ -11,7 +20,15 @@ class PensionAdvisorDesktop:
         self.root.geometry("800x900")
         self.root.configure(bg='#f0f0f0')
         
+        # 规划计算由共享核心完成，在单个后台线程中执行，Tk 控件只在主线程访问
+        self.advisor = PensionAdvisorCore(use_ai=False)
+        self.report_renderer = ReportRenderer("text")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plan")
+        self._pending = None
+        self._plan_cache = OrderedDict()
+        
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         
     def setup_ui(self):
         # 创建主框架
@@ -117,10 +134,22 @@ class PensionAdvisorDesktop:
         button_frame = ttk.Frame(self.input_frame)
         button_frame.pack(fill=tk.X, pady=20)
         
-        ttk.Button(button_frame, 
-                  text="🚀 生成养老规划", 
-                  command=self.generate_plan,
-                  style="Accent.TButton").pack(pady=10)
+        self.generate_button = ttk.Button(button_frame, 
+                                          text="🚀 生成养老规划", 
+                                          command=self.generate_plan,
+                                          style="Accent.TButton")
+        self.generate_button.pack(pady=10)
+        
+        self.cancel_button = ttk.Button(button_frame,
+                                        text="取消",
+                                        command=self.cancel_plan,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack()
+        
+        self.progress = ttk.Progressbar(button_frame, mode="indeterminate", length=300)
+        self.progress.pack(pady=(10, 0))
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(button_frame, textvariable=self.status_var).pack()
         
         # 配置强调按钮样式
         style = ttk.Style()
@@ -139,219 +168,128 @@ class PensionAdvisorDesktop:
         self.result_text.insert(tk.END, "请填写左侧信息并点击'生成养老规划'按钮...")
         self.result_text.config(state=tk.DISABLED)
     
-    def calculate_risk_profile(self):
-        """计算风险偏好"""
-        score = 0
-        answers = [self.risk_q1.get(), self.risk_q2.get(), self.risk_q3.get()]
-        
-        for answer in answers:
-            if answer == 'A':
-                score += 1
-            elif answer == 'B':
-                score += 2
-            elif answer == 'C':
-                score += 3
-        
-        age = int(self.age_var.get())
-        
-        # 年龄调整
-        age_factor = max(0, (40 - age) / 20)
-        adjusted_score = score * (1 + age_factor * 0.3)
-        
-        if adjusted_score <= 3.5:
-            return "保守型", adjusted_score
-        elif adjusted_score <= 6.5:
-            return "稳健型", adjusted_score
-        else:
-            return "进取型", adjusted_score
+    def collect_user_data(self):
+        """从输入框读取并验证用户数据（在 Tk 主线程调用）"""
+        return validate_plan_input({
+            'age': self.age_var.get(),
+            'annual_income': self.income_var.get(),
+            'current_assets': self.assets_var.get(),
+            'monthly_expenses': self.expenses_var.get(),
+            'retirement_age': self.retirement_var.get(),
+            'risk_q1': self.risk_q1.get(),
+            'risk_q2': self.risk_q2.get(),
+            'risk_q3': self.risk_q3.get()
+        })
     
-    def calculate_retirement_needs(self):
-        """计算养老资金需求"""
-        age = int(self.age_var.get())
-        retirement_age = int(self.retirement_var.get())
-        monthly_expenses = int(self.expenses_var.get())
-        
-        years_to_retire = retirement_age - age
-        annual_expenses = monthly_expenses * 12
-        
-        # 考虑通胀的养老资金估算
-        inflation_rate = 1.03  # 3%年化通胀
-        retirement_years = 25  # 假设退休后生活25年
-        
-        future_annual_expenses = annual_expenses * (inflation_rate ** years_to_retire)
-        total_needed = future_annual_expenses * retirement_years
-        monthly_savings = total_needed / (years_to_retire * 12)
-        
-        return {
-            "years_to_retire": years_to_retire,
-            "annual_expenses": annual_expenses,
-            "total_retirement_needed": int(total_needed),
-            "monthly_savings_needed": int(monthly_savings)
-        }
+    def compute_plan(self, user_data, cancel_event):
+        """在后台线程计算规划；不得访问任何 Tk 控件
+
+        各阶段之间检查 cancel_event，已取消时返回 None。
+        """
+        allocation, risk_type = self.advisor.generate_portfolio_allocation(user_data)
+        if cancel_event.is_set():
+            return None
+        retirement_data = self.advisor.calculate_retirement_needs(user_data)
+        if cancel_event.is_set():
+            return None
+        product_recommendations = self.advisor.get_product_recommendations(allocation, risk_type)
+        if cancel_event.is_set():
+            return None
+        return risk_type, retirement_data, allocation, product_recommendations
     
-    def generate_portfolio_allocation(self, risk_type):
-        """生成投资组合配置"""
-        age = int(self.age_var.get())
-        assets = int(self.assets_var.get())
-        
-        if risk_type == "保守型":
-            if age < 35:
-                allocation = {"股票": 20, "债券": 50, "现金": 25, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 15, "债券": 55, "现金": 25, "另类投资": 5}
-            else:
-                allocation = {"股票": 10, "债券": 60, "现金": 25, "另类投资": 5}
-                
-        elif risk_type == "稳健型":
-            if age < 35:
-                allocation = {"股票": 50, "债券": 35, "现金": 10, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 40, "债券": 40, "现金": 15, "另类投资": 5}
-            else:
-                allocation = {"股票": 30, "债券": 45, "现金": 20, "另类投资": 5}
-                
-        else:  # 进取型
-            if age < 35:
-                allocation = {"股票": 70, "债券": 20, "现金": 5, "另类投资": 5}
-            elif age < 50:
-                allocation = {"股票": 60, "债券": 25, "现金": 10, "另类投资": 5}
-            else:
-                allocation = {"股票": 50, "债券": 30, "现金": 15, "另类投资": 5}
-        
-        # 资产规模调整
-        if assets > 500000:
-            allocation["另类投资"] += 5
-            allocation["股票"] -= 3
-            allocation["债券"] -= 2
-        
-        return allocation
+    def generate_plan(self):
+        """生成完整的养老规划（计算在后台线程进行，界面保持响应）"""
+        try:
+            user_data = self.collect_user_data()
+        except PlanInputError as e:
+            messagebox.showerror("输入错误", str(e))
+            return
+        
+        cache_key = tuple(sorted(user_data.items()))
+        cached = self._plan_cache.get(cache_key)
+        if cached is not None:
+            # 输入未变化，直接复用上次的计算结果
+            self._plan_cache.move_to_end(cache_key)
+            self.show_plan(user_data, cached)
+            return
+        
+        self.cancel_plan()
+        cancel_event = threading.Event()
+        future = self._executor.submit(self.compute_plan, user_data, cancel_event)
+        self._pending = (future, cancel_event, user_data, cache_key)
+        self.set_busy(True)
+        self.root.after(PLAN_POLL_INTERVAL_MS, self._poll_plan, future)
     
-    def get_product_recommendations(self, allocation):
-        """获取产品推荐"""
-        product_database = {
-            "股票": ["沪深300指数基金", "中证500指数基金", "科技行业基金", "消费行业基金"],
-            "债券": ["国债", "地方政府债基金", "高等级企业债基金", "可转债基金"],
-            "现金": ["货币市场基金", "银行理财产品", "短期定期存款"],
-            "另类投资": ["黄金ETF", "REITs基金", "大宗商品基金"]
-        }
-        
-        recommendations = {}
-        for category, percentage in allocation.items():
-            if percentage > 0 and category in product_database:
-                products = product_database[category]
-                num_products = min(len(products), max(1, percentage // 20))
-                recommendations[category] = {
-                    "percentage": percentage,
-                    "products": products[:num_products]
-                }
-        
-        return recommendations
+    def cancel_plan(self):
+        """取消正在进行的规划计算，已在运行的阶段结束后丢弃其结果"""
+        if self._pending is None:
+            return
+        future, cancel_event, _, _ = self._pending
+        cancel_event.set()
+        future.cancel()
+        self._pending = None
+        self.set_busy(False)
     
-    def generate_plan(self):
-        """生成完整的养老规划"""
+    def _poll_plan(self, future):
+        """由 root.after 在主线程轮询后台任务，完成后在主线程更新界面"""
+        if self._pending is None or self._pending[0] is not future:
+            return
+        if not future.done():
+            self.root.after(PLAN_POLL_INTERVAL_MS, self._poll_plan, future)
+            return
+        
+        _, _, user_data, cache_key = self._pending
+        self._pending = None
+        self.set_busy(False)
         try:
-            # 验证输入
-            age = int(self.age_var.get())
-            retirement_age = int(self.retirement_var.get())
-            
-            if retirement_age <= age:
-                messagebox.showerror("输入错误", "退休年龄必须大于当前年龄")
-                return
-            
-            # 计算各项数据
-            risk_type, risk_score = self.calculate_risk_profile()
-            retirement_data = self.calculate_retirement_needs()
-            allocation = self.generate_portfolio_allocation(risk_type)
-            product_recommendations = self.get_product_recommendations(allocation)
-            
-            # 生成报告
-            report = self.generate_report(risk_type, retirement_data, allocation, product_recommendations)
-            
-            # 显示结果
-            self.result_text.config(state=tk.NORMAL)
-            self.result_text.delete(1.0, tk.END)
-            self.result_text.insert(tk.END, report)
-            self.result_text.config(state=tk.DISABLED)
-            
-            # 切换到结果选项卡
-            self.notebook.select(1)
-            
-        except ValueError as e:
-            messagebox.showerror("输入错误", "请输入有效的数字")
+            plan = future.result()
         except Exception as e:
             messagebox.showerror("错误", f"生成规划时出错: {str(e)}")
+            return
+        if plan is None:
+            return
+        
+        self._plan_cache[cache_key] = plan
+        if len(self._plan_cache) > PLAN_CACHE_SIZE:
+            self._plan_cache.popitem(last=False)
+        self.show_plan(user_data, plan)
     
-    def generate_report(self, risk_type, retirement_data, allocation, product_recommendations):
-        """生成格式化报告"""
-        report = f"""
-{'='*70}
-📊 个性化养老规划综合报告
-生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-{'='*70}
-
-👤 客户档案
-{'─'*70}
-   年龄: {self.age_var.get()}岁
-   年收入: {int(self.income_var.get()):,}元
-   现有资产: {int(self.assets_var.get()):,}元
-   月支出: {int(self.expenses_var.get()):,}元
-   计划退休: {self.retirement_var.get()}岁
-   风险偏好: {risk_type}
-
-💰 养老需求分析
-{'─'*70}
-   距离退休: {retirement_data['years_to_retire']}年
-   当前年支出: {retirement_data['annual_expenses']:,}元
-   预计养老资金需求: {retirement_data['total_retirement_needed']:,}元
-   建议月储蓄额: {retirement_data['monthly_savings_needed']:,}元
-
-🎯 投资配置建议
-{'─'*70}
-"""
-        
-        # 添加配置详情
-        total_percentage = 0
-        for category, percentage in allocation.items():
-            if percentage > 0:
-                report += f"   {category}: {percentage}%\n"
-                total_percentage += percentage
-        
-        report += f"   总计: {total_percentage}%\n\n"
-        
-        # 产品推荐
-        report += "📈 具体产品推荐\n"
-        report += "─"*70 + "\n"
-        for category, info in product_recommendations.items():
-            report += f"\n   {category} ({info['percentage']}%):\n"
-            for product in info['products']:
-                report += f"      • {product}\n"
-        
-        # 行动计划
-        report += f"""
-💡 行动计划
-{'─'*70}
-   1. 立即开始每月储蓄 {retirement_data['monthly_savings_needed']:,}元
-   2. 按照上述比例配置现有资产
-   3. 每半年回顾调整投资组合
-   4. 随着年龄增长逐步降低风险暴露
-
-📝 实施建议
-{'─'*70}
-   • 建立专门的养老储蓄账户
-   • 设置每月自动转账
-   • 定期学习理财知识
-   • 保持长期投资心态
-
-⚠️ 风险提示
-{'─'*70}
-   1. 本建议基于提供信息生成，仅供参考
-   2. 投资有风险，过往业绩不代表未来表现
-   3. 市场波动可能导致短期亏损
-   4. 建议咨询专业理财顾问完善规划
-
-{'='*70}
-"""
-        return report
+    def set_busy(self, busy):
+        """切换进度条、生成和取消按钮的状态"""
+        if busy:
+            self.generate_button.config(state=tk.DISABLED)
+            self.cancel_button.config(state=tk.NORMAL)
+            self.progress.start(10)
+            self.status_var.set("正在生成规划...")
+        else:
+            self.progress.stop()
+            self.generate_button.config(state=tk.NORMAL)
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status_var.set("")
+    
+    def show_plan(self, user_data, plan):
+        """生成报告并切换到结果选项卡"""
+        risk_type, retirement_data, allocation, product_recommendations = plan
+        report = self.generate_report(user_data, risk_type, retirement_data, allocation, product_recommendations)
+        
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, report)
+        self.result_text.config(state=tk.DISABLED)
+        
+        self.notebook.select(1)
+    
+    def close(self):
+        """关闭窗口：取消后台任务并释放工作线程"""
+        self.cancel_plan()
+        self._executor.shutdown(wait=False)
+        self.root.destroy()
+    
+    def generate_report(self, user_data, risk_type, retirement_data, allocation, product_recommendations):
+        """生成格式化报告（纯文本模板见 report_renderer）"""
+        context = report_context({**user_data, "risk_profile": risk_type}, retirement_data, allocation,
+                                 product_recommendations)
+        return self.report_renderer.render(context)
 
 def main():
     root = tk.Tk()
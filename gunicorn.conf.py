@@ -0,0 +1,75 @@
+# gunicorn.conf.py - 生产环境部署配置
+#
+# 启动:  gunicorn -c gunicorn.conf.py app:app
+#
+# 环境变量:
+#   PORT                      监听端口（默认 8080）
+#   WEB_CONCURRENCY           worker 进程数（默认 CPU 核数；规划计算是 CPU 密集型，多开进程无益）
+#   GUNICORN_THREADS          每个 worker 的线程数（默认 4；流式/SSE 接口和 AI 建议在等待模型时占用线程）
+#   GUNICORN_TIMEOUT          worker 无响应多少秒后被重启（默认 60）
+#   GUNICORN_GRACEFUL_TIMEOUT 重启/退出时等待在途请求完成的秒数（默认 30）
+#   GUNICORN_MAX_REQUESTS     每个 worker 处理多少请求后自动替换（默认 0，不替换）
+#   PROMETHEUS_MULTIPROC_DIR  多进程监控指标目录（见 metrics.py；默认为临时目录下按端口区分的子目录）
+#
+# preload_app: 主进程导入 app 时即建好配置规则表、下滑路径表、产品目录和蒙特卡洛假设，
+# 再 fork 出 worker，这些只读数据以写时复制方式共享。
+#
+# 平滑重启（不丢请求）:
+#   kill -HUP <master>     按新配置逐个替换 worker，旧 worker 处理完在途请求后退出；
+#                          预加载模式下不会重新导入代码
+#   部署新代码时:
+#   kill -USR2 <master>    启动新的 master（重新导入代码并预加载），与旧 master 共用监听端口
+#   kill -TERM <旧 master> 新 worker 就绪后执行；旧 worker 处理完在途请求后退出，旧 master 随之退出
+#   （设置 GUNICORN_PIDFILE 时，旧 master 的 PID 在该文件中，新 master 的在 <pidfile>.2，旧 master 退出后改名）
+#   worker 退出时会关闭空闲的长连接，客户端对幂等请求应在连接被重置时重试
+import gc
+import multiprocessing
+import os
+import tempfile
+
+# 规划计算按请求并行，每个进程内的 BLAS/OpenMP 线程设为 1，避免 worker × 线程 超额订阅 CPU；
+# 必须在导入 numpy（即预加载 app）之前设置
+for _variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_variable, "1")
+
+_port = os.environ.get("PORT", "8080")
+bind = f"0.0.0.0:{_port}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+pidfile = os.environ.get("GUNICORN_PIDFILE")
+accesslog = "-"
+errorlog = "-"
+
+# 多进程监控指标目录: 多个 worker 的计数必须写入共享目录才能在 /metrics 中汇总，
+# 所以无论用哪种方式启动都要在预加载 app（导入 metrics）之前设置；同一端口只能有一个实例，按端口区分目录。
+# 首次启动时清空上次运行遗留的指标文件；USR2 重新执行 master 时（GUNICORN_FD 已设置）旧 worker 仍在写入，不能清空
+_metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"pension-advisor-metrics-{_port}")
+)
+os.makedirs(_metrics_dir, exist_ok=True)
+if "GUNICORN_FD" not in os.environ:
+    for _name in os.listdir(_metrics_dir):
+        if _name.endswith(".db"):
+            os.remove(os.path.join(_metrics_dir, _name))
+
+
+def when_ready(server):
+    """预加载完成、fork worker 之前: 把已有对象移出垃圾回收的跟踪范围，
+    避免 worker 中的垃圾回收改写这些对象所在的内存页而触发复制"""
+    gc.collect()
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    """worker 退出后清理其多进程监控指标文件"""
+    import metrics
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,95 @@
+# metrics.py - Prometheus 监控指标
+#
+# 多进程部署时需设置环境变量 PROMETHEUS_MULTIPROC_DIR（指向一个空目录；gunicorn.conf.py 未设置时自动设置），
+# 各 worker 把指标写入该目录下的 mmap 文件，/metrics 汇总所有进程的数据；
+# worker 退出时需调用 mark_process_dead(pid)（见 gunicorn 配置的 child_exit 钩子）。
+import os
+import time
+
+from flask import g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+REQUEST_COUNT = Counter(
+    "pension_http_requests_total", "HTTP 请求数",
+    ["route", "method", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "pension_http_request_duration_seconds", "HTTP 请求处理耗时",
+    ["route", "method"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "pension_http_requests_in_flight", "正在处理的 HTTP 请求数",
+    ["route"],
+    multiprocess_mode="livesum"
+)
+PLAN_STAGE_LATENCY = Histogram(
+    "pension_plan_stage_duration_seconds", "generate_comprehensive_plan 各阶段耗时",
+    ["stage"],
+    buckets=(0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01, 0.1, 1.0, 10.0)
+)
+
+# 预先取出带标签的子指标，避免每次观测都查找标签
+_STAGE_HISTOGRAMS = {
+    stage: PLAN_STAGE_LATENCY.labels(stage)
+    for stage in ("allocation", "retirement_needs", "product_recommendations", "advice")
+}
+
+
+def observe_plan_stage(stage, seconds):
+    """PensionAdvisorCore.stage_observer 回调"""
+    histogram = _STAGE_HISTOGRAMS.get(stage)
+    if histogram is None:
+        histogram = _STAGE_HISTOGRAMS[stage] = PLAN_STAGE_LATENCY.labels(stage)
+    histogram.observe(seconds)
+
+
+def _route_label():
+    # 使用路由模板而不是实际路径，避免标签基数失控
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def init_app(app, advisor=None):
+    """为 Flask 应用注册请求计量钩子和 /metrics 端点"""
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_started = time.perf_counter()
+        g._metrics_route = _route_label()
+        REQUESTS_IN_FLIGHT.labels(g._metrics_route).inc()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.get("_metrics_started")
+        if started is not None:
+            route = g._metrics_route
+            REQUEST_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+            REQUEST_COUNT.labels(route, request.method, str(response.status_code)).inc()
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        # 流式响应的 teardown 在响应体发送完后才执行，在途数因此覆盖整个传输过程
+        route = g.pop("_metrics_route", None)
+        if route is not None:
+            REQUESTS_IN_FLIGHT.labels(route).dec()
+
+    @app.route("/metrics")
+    def metrics():
+        """Prometheus 文本格式的监控指标"""
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return app.response_class(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    if advisor is not None:
+        advisor.stage_observer = observe_plan_stage
+
+
+def mark_process_dead(pid):
+    """gunicorn worker 退出时清理其在途数（livesum）等指标文件"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
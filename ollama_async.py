@@ -0,0 +1,146 @@
+# ollama_async.py - 异步、限流的 Ollama 调用客户端
+#
+# 多个用户会话共享一个 AsyncOllamaClient：
+#   - 信号量限制同时发往模型的请求数
+#   - 复用 keep-alive 连接池，避免每次调用重新建立连接
+#   - 每次调用有总超时，网络错误和 5xx 按指数退避重试
+#
+# 压测（配合 stub_ollama.py，无需真实模型）:
+#   python stub_ollama.py --port 11435 --latency 1.5
+#   python ollama_async.py --base-url http://127.0.0.1:11435 --requests 64 --concurrency 8
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+DEFAULT_MODEL = "deepseek-r1:1.5b"
+DEFAULT_BASE_URL = "http://localhost:11434"
+
+
+class AsyncOllamaClient:
+    """Ollama /api/generate 的异步客户端"""
+
+    def __init__(self, base_url=None, model=DEFAULT_MODEL, temperature=0.3,
+                 max_concurrency=4, timeout=120.0, connect_timeout=5.0, retries=2, backoff=0.5):
+        self.base_url = base_url or os.environ.get("OLLAMA_HOST", DEFAULT_BASE_URL)
+        self.model = model
+        self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore = None
+        self._client = None
+
+    def _ensure_client(self):
+        """在当前事件循环中懒创建连接池和信号量"""
+        if self._client is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(max_connections=self.max_concurrency,
+                                    max_keepalive_connections=self.max_concurrency),
+            )
+        return self._client
+
+    def _payload(self, prompt, stream=False):
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {"temperature": self.temperature},
+        }
+
+    async def generate(self, prompt):
+        """生成完整回复文本；超时或重试耗尽时抛出最后一次的异常"""
+        client = self._ensure_client()
+        last_error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                # 只在真正发请求时占用并发名额，退避等待期间不占用
+                async with self._semaphore:
+                    response = await asyncio.wait_for(
+                        client.post("/api/generate", json=self._payload(prompt)), self.timeout
+                    )
+                response.raise_for_status()
+                return response.json()["response"]
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code < 500:
+                    raise
+                last_error = e
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                last_error = e
+        raise last_error
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        self._ensure_client()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+async def load_test(client, n_requests, prompt="请给出一条养老投资建议。"):
+    """并发发送 n_requests 个请求，返回吞吐量和延迟分位数"""
+    latencies = []
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            await client.generate(prompt)
+            latencies.append(time.perf_counter() - started)
+        except Exception:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def percentile(q):
+        if not latencies:
+            return None
+        return round(latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))], 3)
+
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50": percentile(50),
+        "p95": percentile(95),
+        "max": round(latencies[-1], 3) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ollama 异步客户端压测")
+    parser.add_argument("--base-url", default=None, help="Ollama 地址，默认读取 OLLAMA_HOST")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    async def run():
+        async with AsyncOllamaClient(args.base_url, max_concurrency=args.concurrency, timeout=args.timeout) as client:
+            return await load_test(client, args.requests)
+
+    print(asyncio.run(run()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
 # pension_advisor_improved.py
-from langchain_ollama import OllamaLLM
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.schema import BaseOutputParser
+import time
+
+_MODULE_IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import sys
 import json
-from datetime import datetime
 import os
+import threading
+
+from advisor_core import lookup_allocation
+from advice_cache import AdviceCache, parse_buckets
+from advice_stream import build_advice_prompt, filter_think_stream, strip_think
+from report_renderer import ReportRenderer, report_context
 
-print("=" * 60)
-print("🤖 智能养老规划助手 - 专业版")
-print("=" * 60)
-print("正在初始化 deepseek-r1:1.5b 模型...")
+MODEL_NAME = "deepseek-r1:1.5b"
+MODEL_TEMPERATURE = 0.3
 
-class InvestmentAdviceParser(BaseOutputParser):
-    """解析AI的投资建议"""
+class InvestmentAdviceParser:
+    """解析AI的投资建议
+
+    不继承 langchain 的 BaseOutputParser，这样导入本模块时不必加载 langchain；
+    这里只用到 parse() 方法。
+    """
     def parse(self, text: str):
         # 简单的解析，提取关键信息
         return {
@@ -23,16 +32,20 @@ class InvestmentAdviceParser(BaseOutputParser):
         }
 
 class ImprovedPensionAdvisor:
-    def __init__(self):
-        try:
-            # 使用新的 OllamaLLM 替代弃用的 Ollama
-            self.llm = OllamaLLM(model="deepseek-r1:1.5b", temperature=0.3)
-            self.model_loaded = True
-            print("✅ deepseek-r1:1.5b 模型加载成功！")
-        except Exception as e:
-            print(f"❌ 模型加载失败: {e}")
-            self.model_loaded = False
-            return
+    def __init__(self, advice_cache=None, load_model=True, warm_up=True):
+        # 可选的AI建议持久化缓存（AdviceCache）
+        self.advice_cache = advice_cache
+        
+        # 模型在后台线程中加载（导入 langchain、创建客户端、发送预热请求），
+        # 用户回答问题期间完成，生成报告时才等待
+        self.warm_up = warm_up
+        self._llm = None
+        self._model_error = None
+        self._model_ready = threading.Event()
+        self._model_thread = None
+        self.timings = {}
+        if load_model:
+            self.start_model_loading()
         
         # 更专业的对话流程
         self.conversation_stages = {
@@ -63,7 +76,59 @@ class ImprovedPensionAdvisor:
         }
         
         self.parser = InvestmentAdviceParser()
+        self.report_renderer = ReportRenderer("text")
         
+    def start_model_loading(self):
+        """启动后台模型加载（重复调用无副作用）"""
+        if self._model_thread is None and not self._model_ready.is_set():
+            self._model_thread = threading.Thread(target=self._load_model, name="model-loader", daemon=True)
+            self._model_thread.start()
+    
+    def _load_model(self):
+        """后台线程：延迟导入 langchain 并创建 OllamaLLM，随后预热模型"""
+        started = time.perf_counter()
+        try:
+            from langchain_ollama import OllamaLLM
+            self.timings["langchain_import"] = time.perf_counter() - started
+            
+            # 使用新的 OllamaLLM 替代弃用的 Ollama
+            self._llm = OllamaLLM(model=MODEL_NAME, temperature=MODEL_TEMPERATURE)
+            self.timings["model_init"] = time.perf_counter() - started
+        except Exception as e:
+            self._model_error = e
+            self._model_ready.set()
+            return
+        self._model_ready.set()
+        
+        if self.warm_up:
+            # 预热：让 Ollama 把模型载入内存，只生成 1 个 token；失败不影响后续使用
+            try:
+                OllamaLLM(model=MODEL_NAME, temperature=MODEL_TEMPERATURE, num_predict=1).invoke("你好")
+                self.timings["warm_up"] = time.perf_counter() - started
+            except Exception as e:
+                self.timings["warm_up_error"] = str(e)
+    
+    @property
+    def llm(self):
+        """等待后台加载完成后返回模型客户端，加载失败时抛出原始异常"""
+        self.start_model_loading()
+        self._model_ready.wait()
+        if self._model_error is not None:
+            raise self._model_error
+        return self._llm
+    
+    @llm.setter
+    def llm(self, value):
+        # 允许直接注入模型客户端（例如测试或压测用的桩对象）
+        self._llm = value
+        self._model_error = None
+        self._model_ready.set()
+    
+    @property
+    def model_loaded(self):
+        """模型尚未加载失败（加载中也视为可用）"""
+        return self._model_error is None
+    
     def start_conversation(self):
         if not self.model_loaded:
             return
@@ -125,36 +190,8 @@ class ImprovedPensionAdvisor:
         age = int(self.user_profile['age'])
         assets = int(self.user_profile.get('assets', 0))
         
-        # 更复杂的配置逻辑
-        if risk_type == "保守型":
-            if age < 35:
-                base_allocation = {"股票": 20, "债券": 50, "现金": 25, "另类": 5}
-            elif age < 50:
-                base_allocation = {"股票": 15, "债券": 55, "现金": 25, "另类": 5}
-            else:
-                base_allocation = {"股票": 10, "债券": 60, "现金": 25, "另类": 5}
-                
-        elif risk_type == "稳健型":
-            if age < 35:
-                base_allocation = {"股票": 50, "债券": 35, "现金": 10, "另类": 5}
-            elif age < 50:
-                base_allocation = {"股票": 40, "债券": 40, "现金": 15, "另类": 5}
-            else:
-                base_allocation = {"股票": 30, "债券": 45, "现金": 20, "另类": 5}
-                
-        else:  # 进取型
-            if age < 35:
-                base_allocation = {"股票": 70, "债券": 20, "现金": 5, "另类": 5}
-            elif age < 50:
-                base_allocation = {"股票": 60, "债券": 25, "现金": 10, "另类": 5}
-            else:
-                base_allocation = {"股票": 50, "债券": 30, "现金": 15, "另类": 5}
-        
-        # 根据资产规模微调
-        if assets > 500000:  # 资产较多时增加分散化
-            base_allocation["另类"] += 5
-            base_allocation["股票"] -= 3
-            base_allocation["债券"] -= 2
+        # 共享的配置规则表（与 Web 版、桌面版一致）
+        base_allocation = lookup_allocation(risk_type, age, assets)
         
         return base_allocation, risk_type
     
@@ -172,38 +209,82 @@ class ImprovedPensionAdvisor:
                 }
         return recommendations
     
+    def build_advice_prompt(self, allocation, risk_type, retirement_data):
+        """构造AI建议的提示词"""
+        return build_advice_prompt(self.user_profile, allocation, risk_type, retirement_data)
+    
+    def advice_fingerprint(self, allocation, risk_type, retirement_data, model, temperature):
+        """AI建议缓存键：只包含提示词实际用到的字段"""
+        fields = {
+            "age": self.user_profile.get('age'),
+            "income": self.user_profile.get('income'),
+            "assets": self.user_profile.get('assets'),
+            "expenses": self.user_profile.get('expenses'),
+            "retirement_age": self.user_profile.get('retirement_age', 60),
+            "risk_type": risk_type,
+            "allocation": dict(allocation),
+            "retirement_data": retirement_data,
+        }
+        return self.advice_cache.fingerprint(fields, model, temperature)
+    
     def generate_ai_advice(self, allocation, risk_type, retirement_data):
         """使用AI生成个性化建议"""
         try:
-            prompt = f"""
-用户档案：
-- 年龄: {self.user_profile['age']}岁
-- 年收入: {self.user_profile['income']}元
-- 现有资产: {self.user_profile['assets']}元
-- 月支出: {self.user_profile.get('expenses', '未知')}元
-- 计划退休年龄: {self.user_profile.get('retirement_age', 60)}岁
-- 风险偏好: {risk_type}
-
-养老需求分析：
-- 距离退休: {retirement_data['years_to_retire']}年
-- 预计所需养老资金: {retirement_data['total_retirement_needed']:,}元
-- 建议每月储蓄: {retirement_data['monthly_savings_needed']:,}元
-
-投资配置：
-{allocation}
-
-请用专业但易懂的中文给出：
-1. 对这个配置的简要评价
-2. 针对该用户的2-3条具体建议
-3. 重要的风险提示
-
-请保持回答简洁明了，不超过200字。
-"""
-            response = self.llm.invoke(prompt)
-            return response.strip()
+            prompt = self.build_advice_prompt(allocation, risk_type, retirement_data)
+            if self.advice_cache is None:
+                response = self.llm.invoke(prompt)
+                return strip_think(response).strip()
+            
+            # 相同指纹的建议直接复用，并发的相同请求只调用一次模型
+            key = self.advice_fingerprint(allocation, risk_type, retirement_data, MODEL_NAME, MODEL_TEMPERATURE)
+            parsed = self.advice_cache.get_or_compute(
+                key, lambda: self.parser.parse(strip_think(self.llm.invoke(prompt)).strip()),
+                MODEL_NAME, MODEL_TEMPERATURE
+            )
+            return parsed["raw_advice"]
         except Exception as e:
             return f"AI建议生成遇到技术问题: {str(e)}"
     
+    async def generate_ai_advice_async(self, allocation, risk_type, retirement_data, client):
+        """异步生成AI建议（client 为多个会话共享的 AsyncOllamaClient）"""
+        try:
+            prompt = self.build_advice_prompt(allocation, risk_type, retirement_data)
+            if self.advice_cache is None:
+                response = await client.generate(prompt)
+                return strip_think(response).strip()
+            
+            async def compute():
+                response = await client.generate(prompt)
+                return self.parser.parse(strip_think(response).strip())
+            
+            key = self.advice_fingerprint(allocation, risk_type, retirement_data, client.model, client.temperature)
+            parsed = await self.advice_cache.aget_or_compute(key, compute, client.model, client.temperature)
+            return parsed["raw_advice"]
+        except Exception as e:
+            return f"AI建议生成遇到技术问题: {str(e) or type(e).__name__}"
+    
+    def stream_ai_advice(self, allocation, risk_type, retirement_data):
+        """逐段产出AI建议，<think> 推理块在输出过程中即被过滤"""
+        try:
+            key = None
+            if self.advice_cache is not None:
+                key = self.advice_fingerprint(allocation, risk_type, retirement_data, MODEL_NAME, MODEL_TEMPERATURE)
+                parsed = self.advice_cache.get(key)
+                if parsed is not None:
+                    yield parsed["raw_advice"]
+                    return
+            
+            prompt = self.build_advice_prompt(allocation, risk_type, retirement_data)
+            pieces = []
+            for text in filter_think_stream(self.llm.stream(prompt)):
+                pieces.append(text)
+                yield text
+            
+            if key is not None:
+                self.advice_cache.put(key, self.parser.parse("".join(pieces).strip()), MODEL_NAME, MODEL_TEMPERATURE)
+        except Exception as e:
+            yield f"AI建议生成遇到技术问题: {str(e)}"
+    
     def generate_comprehensive_report(self):
         """生成完整的养老规划报告"""
         # 计算各项数据
@@ -212,62 +293,41 @@ class ImprovedPensionAdvisor:
         product_recommendations = self.get_product_recommendations(allocation)
         ai_advice = self.generate_ai_advice(allocation, risk_type, retirement_data)
         
-        # 生成报告
-        report = f"""
-{'='*70}
-📊 个性化养老规划综合报告
-生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M')}
-{'='*70}
-
-👤 客户档案
-{'─'*70}
-   ▪ 年龄: {self.user_profile['age']}岁
-   ▪ 年收入: {self.user_profile['income']:,}元
-   ▪ 现有资产: {self.user_profile['assets']:,}元
-   ▪ 月支出: {self.user_profile.get('expenses', '未提供')}元
-   ▪ 计划退休: {self.user_profile.get('retirement_age', 60)}岁
-   ▪ 风险偏好: {risk_type}
-
-💰 养老需求分析
-{'─'*70}
-   ▪ 距离退休: {retirement_data['years_to_retire']}年
-   ▪ 预计养老资金需求: {retirement_data['total_retirement_needed']:,}元
-   ▪ 建议月储蓄额: {retirement_data['monthly_savings_needed']:,}元
-
-🎯 投资配置建议
-{'─'*70}
-"""
+        context = self.report_context(risk_type, retirement_data, allocation, product_recommendations)
+        return self.report_renderer.render(context, ai_advice)
+    
+    async def generate_comprehensive_report_async(self, client):
+        """异步生成完整的养老规划报告，等待模型时不阻塞事件循环"""
+        allocation, risk_type = self.generate_portfolio_allocation()
+        retirement_data = self.calculate_retirement_needs()
+        product_recommendations = self.get_product_recommendations(allocation)
+        ai_advice = await self.generate_ai_advice_async(allocation, risk_type, retirement_data, client)
         
-        # 添加配置详情
-        for category, info in product_recommendations.items():
-            report += f"   ▪ {category}: {info['percentage']}%\n"
-            for product in info['products']:
-                report += f"      - {product}\n"
+        context = self.report_context(risk_type, retirement_data, allocation, product_recommendations)
+        return self.report_renderer.render(context, ai_advice)
+    
+    def report_context(self, risk_type, retirement_data, allocation, product_recommendations):
+        """把对话中收集的档案整理成 report_renderer 使用的报告数据"""
+        profile = {
+            "age": self.user_profile['age'],
+            "annual_income": self.user_profile['income'],
+            "current_assets": self.user_profile['assets'],
+            "monthly_expenses": self.user_profile.get('expenses', '未提供'),
+            "retirement_age": self.user_profile.get('retirement_age', 60),
+            "risk_profile": risk_type,
+        }
+        return report_context(profile, retirement_data, allocation, product_recommendations)
+    
+    def generate_comprehensive_report_stream(self):
+        """流式生成报告：确定性部分立即产出，AI建议逐段追加，最后产出结尾部分"""
+        allocation, risk_type = self.generate_portfolio_allocation()
+        retirement_data = self.calculate_retirement_needs()
+        product_recommendations = self.get_product_recommendations(allocation)
         
-        report += f"""
-💡 专业建议
-{'─'*70}
-   {ai_advice}
-
-📈 行动计划
-{'─'*70}
-   1. 立即开始每月储蓄 {retirement_data['monthly_savings_needed']:,}元
-   2. 按照上述比例配置现有资产
-   3. 每半年回顾调整投资组合
-   4. 随着年龄增长逐步降低风险
-
-⚠️ 风险提示
-{'─'*70}
-   1. 本建议基于提供信息生成，仅供参考
-   2. 投资有风险，过往业绩不代表未来表现
-   3. 建议咨询专业理财顾问完善规划
-   4. 市场波动可能导致短期亏损
-
-{'='*70}
-"""
-        return report
+        context = self.report_context(risk_type, retirement_data, allocation, product_recommendations)
+        yield from self.report_renderer.iter_chunks(context, self.stream_ai_advice(allocation, risk_type, retirement_data))
     
-    def process_user_input(self, user_input):
+    def process_user_input(self, user_input, stream=False):
         if not self.model_loaded:
             return "模型未正确加载，无法继续对话。", True
         
@@ -280,6 +340,9 @@ class ImprovedPensionAdvisor:
         
         # 检查是否所有阶段都已完成
         if self.current_stage_index >= len(self.stages_order):
+            # stream=True 时返回逐段产出报告文本的生成器
+            if stream:
+                return self.generate_comprehensive_report_stream(), True
             report = self.generate_comprehensive_report()
             return report, True
         else:
@@ -287,28 +350,60 @@ class ImprovedPensionAdvisor:
             next_question = self.conversation_stages[next_stage_key]
             return f"小智: {next_question}", False
 
-def main():
-    # 检查是否需要安装新包
-    try:
-        from langchain_ollama import OllamaLLM
-    except ImportError:
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="智能养老规划助手 - 专业版")
+    parser.add_argument('--startup-profile', action='store_true', help="报告导入和初始化耗时")
+    args = parser.parse_args(argv)
+    main_started = time.perf_counter()
+    
+    print("=" * 60)
+    print("🤖 智能养老规划助手 - 专业版")
+    print("=" * 60)
+    
+    # 检查是否需要安装新包（只查找，不导入）
+    import importlib.util
+    if importlib.util.find_spec("langchain_ollama") is None:
         print("❌ 需要安装 langchain-ollama 包")
         print("请运行: pip install langchain-ollama")
         input("按回车键退出...")
         return
     
-    advisor = ImprovedPensionAdvisor()
-    
-    if not advisor.model_loaded:
-        print("❌ 无法启动助手")
-        input("按回车键退出...")
+    # AI建议缓存（设置 ADVICE_CACHE_PATH 为空字符串可关闭）；默认按精确的收入和资产计算指纹，
+    # ADVICE_CACHE_BUCKETS（例如 "income=10000,assets=10000"）可开启分桶以提高命中率，
+    # 但同一桶的客户可能看到引用其他客户精确数字的建议
+    cache_path = os.environ.get('ADVICE_CACHE_PATH', 'advice_cache.sqlite3')
+    try:
+        cache_buckets = parse_buckets(os.environ.get('ADVICE_CACHE_BUCKETS'))
+    except ValueError as e:
+        print(f"❌ ADVICE_CACHE_BUCKETS {e}")
         return
-        
+    advice_cache = AdviceCache(cache_path, buckets=cache_buckets) if cache_path else None
+    
+    init_started = time.perf_counter()
+    advisor = ImprovedPensionAdvisor(advice_cache=advice_cache)
+    init_finished = time.perf_counter()
+    print(f"正在后台加载 {MODEL_NAME} 模型，您可以先回答问题...")
+    
     advisor.start_conversation()
     
     print("\n💡 提示: 您可以随时输入'退出'来结束对话。")
     print("💡 提示: 输入'跳过'可以跳过当前问题。\n")
     
+    if args.startup_profile:
+        first_prompt = time.perf_counter()
+        print("⏱  启动耗时:", file=sys.stderr)
+        print(f"   模块导入: {(main_started - _MODULE_IMPORT_STARTED) * 1000:.0f} ms", file=sys.stderr)
+        print(f"   助手初始化: {(init_finished - init_started) * 1000:.0f} ms", file=sys.stderr)
+        print(f"   到首个提问: {(first_prompt - _MODULE_IMPORT_STARTED) * 1000:.0f} ms", file=sys.stderr)
+        
+        def report_model_timings():
+            if advisor._model_thread is not None:
+                advisor._model_thread.join()
+            for name, seconds in list(advisor.timings.items()):
+                if isinstance(seconds, float):
+                    print(f"\n⏱  后台 {name}: {seconds * 1000:.0f} ms", file=sys.stderr)
+        threading.Thread(target=report_model_timings, daemon=True).start()
+    
     while True:
         try:
             user_input = input("您: ").strip()
@@ -324,16 +419,21 @@ def main():
                 print("小智: 抱歉，我没有收到您的输入，请再说一遍~")
                 continue
                 
-            # 处理用户输入
-            response, should_exit = advisor.process_user_input(user_input)
-            print(f"\n{response}")
+            # 处理用户输入（最终报告边生成边输出）
+            response, should_exit = advisor.process_user_input(user_input, stream=True)
+            if isinstance(response, str):
+                print(f"\n{response}")
+            else:
+                print()
+                for text in response:
+                    print(text, end="", flush=True)
             
             # 检查是否应该退出
             if should_exit:
                 print("\n🎉 报告生成完成！感谢您的使用。")
                 break
                 
-        except KeyboardInterrupt:
+        except (KeyboardInterrupt, EOFError):
             print("\n\n感谢使用！再见！")
             break
         except Exception as e:
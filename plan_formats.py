@@ -0,0 +1,143 @@
+# plan_formats.py - 规划结果的二进制/列式输出格式
+#
+# 规划接口按请求头 Accept 协商响应格式，默认仍为 JSON:
+#   单个规划:  application/msgpack                     （需要 msgpack）
+#   批量规划:  application/vnd.apache.arrow.stream     Arrow IPC 流（需要 pyarrow）
+#              application/vnd.apache.parquet          Parquet 文件（需要 pyarrow）
+# 未安装对应依赖时不提供该格式，协商结果回落到 JSON。
+#
+# 批量结果的列布局固定（列名、顺序和类型见 BATCH_COLUMNS），下游可直接按列读取。
+import numpy as np
+
+from advisor_core import ASSET_CLASSES, RISK_TYPES
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+JSON_MIMETYPE = "application/json"
+MSGPACK_MIMETYPE = "application/msgpack"
+ARROW_STREAM_MIMETYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+
+# 固定字段顺序
+USER_PROFILE_FIELDS = ("age", "annual_income", "current_assets", "monthly_expenses", "retirement_age", "risk_profile")
+RETIREMENT_ANALYSIS_FIELDS = ("years_to_retire", "annual_expenses", "total_retirement_needed", "monthly_savings_needed")
+
+# 批量结果列布局: (列名, NumPy 类型)；risk_profile 为字典编码的字符串列，取值见 RISK_TYPES；
+# error 为字符串列，无效行的其他各列为 null，error 为错误信息，有效行的 error 为 null
+BATCH_COLUMNS = (
+    ("user_profile.age", np.int16),
+    ("user_profile.annual_income", np.int64),
+    ("user_profile.current_assets", np.int64),
+    ("user_profile.monthly_expenses", np.int64),
+    ("user_profile.retirement_age", np.int16),
+    ("user_profile.risk_profile", None),
+    ("user_profile.risk_score", np.float64),
+    ("retirement_analysis.years_to_retire", np.int16),
+    ("retirement_analysis.annual_expenses", np.int64),
+    ("retirement_analysis.total_retirement_needed", np.int64),
+    ("retirement_analysis.monthly_savings_needed", np.int64),
+) + tuple((f"portfolio_allocation.{category}", np.int8) for category in ASSET_CLASSES) + (
+    ("error", None),
+)
+
+
+def single_plan_mimetypes():
+    """单个规划可提供的响应格式（JSON 在前，作为默认）"""
+    return [JSON_MIMETYPE] + ([MSGPACK_MIMETYPE] if msgpack is not None else [])
+
+
+def batch_plan_mimetypes():
+    """批量规划可提供的响应格式（JSON 在前，作为默认）"""
+    return [JSON_MIMETYPE] + ([ARROW_STREAM_MIMETYPE, PARQUET_MIMETYPE] if pa is not None else [])
+
+
+def negotiate(accept_mimetypes, offered):
+    """按 Accept 选择响应格式，没有可接受的格式时回落到 JSON"""
+    return accept_mimetypes.best_match(offered) or JSON_MIMETYPE
+
+
+def plan_record(plan):
+    """把单个规划整理成固定字段顺序的结构，资产配置总是包含全部资产类别"""
+    record = dict(plan)
+    record["user_profile"] = {field: plan["user_profile"][field] for field in USER_PROFILE_FIELDS}
+    record["retirement_analysis"] = {
+        field: plan["retirement_analysis"][field] for field in RETIREMENT_ANALYSIS_FIELDS
+    }
+    record["portfolio_allocation"] = {
+        category: plan["portfolio_allocation"].get(category, 0) for category in ASSET_CLASSES
+    }
+    return record
+
+
+def pack_msgpack(payload):
+    """序列化为 MessagePack（未安装 msgpack 时抛出 RuntimeError）"""
+    if msgpack is None:
+        raise RuntimeError("未安装 msgpack")
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def batch_plan_table(batch_result):
+    """把 generate_batch_plan 的列式结果按 BATCH_COLUMNS 组装成 Arrow 表（数值列直接由 NumPy 数组构造）"""
+    if pa is None:
+        raise RuntimeError("未安装 pyarrow")
+    retirement_data = batch_result["retirement_analysis"]
+    allocation = batch_result["portfolio_allocation"]
+    sources = {
+        "user_profile.risk_score": batch_result["risk_score"],
+        **{f"user_profile.{field}": values for field, values in batch_result["user_profile"].items()},
+        **{f"retirement_analysis.{field}": retirement_data[field] for field in RETIREMENT_ANALYSIS_FIELDS},
+        **{f"portfolio_allocation.{category}": allocation[category] for category in ASSET_CLASSES},
+    }
+
+    invalid = ~batch_result["valid"] if batch_result["errors"] else None
+    errors = np.full(batch_result["count"], None, dtype=object)
+    for row, message in batch_result["errors"]:
+        errors[row] = message
+
+    arrays = []
+    for name, dtype in BATCH_COLUMNS:
+        if name == "error":
+            arrays.append(pa.array(errors, type=pa.string()))
+        elif dtype is None:
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(np.asarray(batch_result["risk_index"], dtype=np.int8), mask=invalid), pa.array(RISK_TYPES)
+            ))
+        else:
+            arrays.append(pa.array(np.asarray(sources[name], dtype=dtype), mask=invalid))
+    return pa.Table.from_arrays(arrays, names=[name for name, _ in BATCH_COLUMNS])
+
+
+def glidepath_table(glidepath_result):
+    """把 generate_glidepath_batch 的结果组装成 Arrow 表: length 列加每个资产类别一个 list<float32> 列，
+    每行只含该客户到退休为止的路径（不含 NaN 填充）"""
+    if pa is None:
+        raise RuntimeError("未安装 pyarrow")
+    allocation = glidepath_result["allocation"]
+    length = np.minimum(glidepath_result["length"], glidepath_result["years"]).astype(np.int32)
+    offsets = np.concatenate(([0], np.cumsum(length, dtype=np.int64))).astype(np.int32)
+    valid = np.arange(glidepath_result["years"]) < length[:, None]
+
+    arrays = [pa.array(length)]
+    for i in range(len(ASSET_CLASSES)):
+        arrays.append(pa.ListArray.from_arrays(pa.array(offsets), pa.array(allocation[:, :, i][valid])))
+    return pa.Table.from_arrays(arrays, names=["length"] + [f"glidepath.{category}" for category in ASSET_CLASSES])
+
+
+def serialize_table(table, mimetype):
+    """把 Arrow 表序列化为 Arrow IPC 流或 Parquet"""
+    sink = pa.BufferOutputStream()
+    if mimetype == PARQUET_MIMETYPE:
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
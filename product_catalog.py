@@ -0,0 +1,173 @@
+# product_catalog.py - 可热加载的产品目录
+#
+# 目录文件为 UTF-8 CSV，每行一个产品:
+#   code,name,category,risk_level,fee,size
+#   category   资产类别（股票/债券/现金/另类投资）
+#   risk_level 产品风险等级 1-5（R1 低风险 ... R5 高风险）
+#   fee        年度综合费率（%）
+#   size       规模（亿元）
+# 默认读取本目录下的 product_catalog.csv，可用环境变量 PRODUCT_CATALOG_PATH 指定其他文件。
+#
+# 加载时按 (资产类别, 风险等级) 建立索引，每个桶内按 费率低、规模大 预先排序；
+# 推荐时对允许的风险等级桶做堆归并，只取前 k 个。
+# 文件修改后（最多每 CATALOG_CHECK_INTERVAL 秒检查一次）在调用线程中重新加载，新索引构建完成后
+# 一次性替换引用；正在进行的推荐继续使用旧索引，不需要加锁等待。新文件有误时保留旧目录。
+import csv
+from collections import namedtuple
+import hashlib
+import heapq
+from itertools import islice
+import logging
+import os
+import threading
+import time
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "product_catalog.csv")
+CATALOG_CHECK_INTERVAL = 2.0
+CATALOG_FIELDS = ("code", "name", "category", "risk_level", "fee", "size")
+
+# 各风险类型可推荐的最高产品风险等级；某类别在此范围内没有产品时退而推荐该类别风险最低的产品
+RISK_LEVEL_LIMITS = {"保守型": 3, "稳健型": 4, "进取型": 5}
+MAX_RISK_LEVEL = 5
+
+logger = logging.getLogger(__name__)
+
+Product = namedtuple("Product", CATALOG_FIELDS)
+
+
+class ProductCatalogError(ValueError):
+    """产品目录文件格式错误"""
+
+
+def _rank(product):
+    """桶内排序键: 费率低优先，其次规模大，最后按代码保证顺序确定"""
+    return (product.fee, -product.size, product.code)
+
+
+class _CatalogSnapshot:
+    """一次加载得到的不可变目录: {资产类别: {风险等级: [按 _rank 排好序的产品]}}"""
+
+    __slots__ = ("index", "count", "version", "signature", "top_k")
+
+    def __init__(self, products, version, signature):
+        index = {}
+        for product in products:
+            index.setdefault(product.category, {}).setdefault(product.risk_level, []).append(product)
+        for buckets in index.values():
+            for bucket in buckets.values():
+                bucket.sort(key=_rank)
+        self.index = index
+        self.count = len(products)
+        self.version = version
+        self.signature = signature
+        # top_products 的结果 {(资产类别, k, 风险等级上限): 产品元组}，随快照一起替换
+        self.top_k = {}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+
+def read_catalog(path):
+    """读取并验证目录文件，返回 (产品列表, 内容摘要)；任何一行有误都会抛出 ProductCatalogError"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    version = hashlib.sha256(raw).hexdigest()[:16]
+
+    reader = csv.DictReader(raw.decode("utf-8-sig").splitlines())
+    missing = [field for field in CATALOG_FIELDS if field not in (reader.fieldnames or ())]
+    if missing:
+        raise ProductCatalogError(f"{path} 缺少列: {', '.join(missing)}")
+
+    products = []
+    seen = set()
+    for line_number, row in enumerate(reader, 2):
+        try:
+            product = Product(
+                code=row["code"].strip(),
+                name=row["name"].strip(),
+                category=row["category"].strip(),
+                risk_level=int(row["risk_level"]),
+                fee=float(row["fee"]),
+                size=float(row["size"]),
+            )
+        except (AttributeError, TypeError, ValueError):
+            raise ProductCatalogError(f"{path} 第 {line_number} 行: 字段缺失或不是有效的数字")
+        if not product.code or not product.name or not product.category:
+            raise ProductCatalogError(f"{path} 第 {line_number} 行: code、name、category 不能为空")
+        if not 1 <= product.risk_level <= MAX_RISK_LEVEL:
+            raise ProductCatalogError(f"{path} 第 {line_number} 行: 风险等级必须在 1 到 {MAX_RISK_LEVEL} 之间")
+        if product.code in seen:
+            raise ProductCatalogError(f"{path} 第 {line_number} 行: 产品代码 {product.code} 重复")
+        seen.add(product.code)
+        products.append(product)
+    return products, version
+
+
+class ProductCatalog:
+    """按资产类别和风险等级索引的产品目录，文件修改后自动重新加载"""
+
+    def __init__(self, path=None, check_interval=CATALOG_CHECK_INTERVAL, clock=time.monotonic):
+        self.path = path or os.environ.get("PRODUCT_CATALOG_PATH") or DEFAULT_CATALOG_PATH
+        self.check_interval = check_interval
+        self._clock = clock
+        self._reload_lock = threading.Lock()
+        self._next_check = clock() + check_interval
+        self._snapshot = self._load()
+        # 加载失败的文件签名，文件再次变化前不重复解析
+        self._failed_signature = None
+
+    def _load(self):
+        signature = _file_signature(self.path)
+        products, version = read_catalog(self.path)
+        return _CatalogSnapshot(products, version, signature)
+
+    @property
+    def version(self):
+        """当前目录内容的摘要（目录变化时改变，可用于缓存键）"""
+        return self._snapshot.version
+
+    def __len__(self):
+        return self._snapshot.count
+
+    def maybe_reload(self):
+        """距上次检查超过 check_interval 秒且文件已变化时重新加载，返回是否替换了目录
+
+        同一时间只有一个线程执行加载，其他线程不等待，继续使用当前目录。
+        """
+        now = self._clock()
+        if now < self._next_check or not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._next_check = now + self.check_interval
+            try:
+                signature = _file_signature(self.path)
+                if signature in (self._snapshot.signature, self._failed_signature):
+                    return False
+                snapshot = self._load()
+            except (OSError, ProductCatalogError) as e:
+                self._failed_signature = signature if isinstance(e, ProductCatalogError) else None
+                logger.warning("产品目录重新加载失败，继续使用旧目录: %s", e)
+                return False
+            self._snapshot = snapshot
+            logger.info("已重新加载产品目录 %s（%d 个产品）", self.path, snapshot.count)
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def top_products(self, category, k, risk_type=None):
+        """某资产类别中排名最前的 k 个产品（元组）；risk_type 为 None 时不按风险等级筛选"""
+        snapshot = self._snapshot
+        limit = RISK_LEVEL_LIMITS.get(risk_type, MAX_RISK_LEVEL)
+        key = (category, k, limit)
+        products = snapshot.top_k.get(key)
+        if products is None:
+            buckets = snapshot.index.get(category)
+            if not buckets or k <= 0:
+                products = ()
+            else:
+                levels = [level for level in buckets if level <= limit] or [min(buckets)]
+                products = tuple(islice(heapq.merge(*(buckets[level] for level in levels), key=_rank), k))
+            snapshot.top_k[key] = products
+        return products
@@ -0,0 +1,157 @@
+# profiling.py - 按需采样的请求性能剖析
+#
+# 开启方式（二选一）:
+#   - 环境变量 PROFILE_SAMPLE_RATE=0.01 按 1% 的比例随机采样请求
+#   - 管理员请求头: X-Admin-Token: <ADMIN_TOKEN> 且 X-Profile: 1，强制剖析该请求
+#
+# 每个被采样的请求在 PROFILE_DIR 下生成一对文件（同名不同后缀）:
+#   <id>.prof  cProfile 数据，可用 python -m pstats 或 snakeviz 打开
+#   <id>.json  请求路径、输入、状态码、墙钟/CPU 耗时
+# 文件数超过 PROFILE_MAX_FILES 时删除最旧的。
+# 管理接口（需 X-Admin-Token）: GET /admin/profiles 列表，GET /admin/profiles/<文件名> 下载。
+import cProfile
+from datetime import datetime
+from functools import wraps
+import hmac
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from flask import abort, current_app, jsonify, request, send_from_directory
+
+_PROFILE_NAME = re.compile(r"^[0-9A-Za-z_.-]+\.(prof|json)$")
+# 记录的请求输入最大字节数
+MAX_RECORDED_INPUT_BYTES = 16 * 1024
+_rotate_lock = threading.Lock()
+# 同一进程内同时只能有一个 cProfile 处于启用状态（Python 3.12 起第二个 enable() 会抛出 ValueError），
+# 已有请求在剖析时，新命中采样的请求不剖析
+_profile_lock = threading.Lock()
+
+
+def _is_admin():
+    token = current_app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _should_profile():
+    if request.headers.get('X-Profile') == '1' and _is_admin():
+        return True
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _rotate(directory, max_files):
+    """只保留最新的 max_files 份剖析数据"""
+    with _rotate_lock:
+        profiles = sorted(name for name in os.listdir(directory) if name.endswith('.prof'))
+        for name in profiles[:max(0, len(profiles) - max_files)]:
+            base = name[:-len('.prof')]
+            for suffix in ('.prof', '.json'):
+                try:
+                    os.remove(os.path.join(directory, base + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def _save_profile(profiler, view_name, status_code, wall_seconds, cpu_seconds):
+    config = current_app.config
+    directory = config['PROFILE_DIR']
+    os.makedirs(directory, exist_ok=True)
+
+    # 文件名以时间开头，按名称排序即按时间排序
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}-{view_name}"
+    profiler.dump_stats(os.path.join(directory, profile_id + '.prof'))
+
+    raw_input = request.get_data(cache=True)[:MAX_RECORDED_INPUT_BYTES]
+    metadata = {
+        "id": profile_id,
+        "view": view_name,
+        "method": request.method,
+        "path": request.full_path.rstrip('?'),
+        "status": status_code,
+        "wall_ms": round(wall_seconds * 1000, 3),
+        "cpu_ms": round(cpu_seconds * 1000, 3),
+        "pid": os.getpid(),
+        "recorded_at": datetime.now().isoformat(),
+        "input": raw_input.decode('utf-8', errors='replace'),
+    }
+    tmp_path = os.path.join(directory, profile_id + '.json.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(directory, profile_id + '.json'))
+
+    _rotate(directory, config.get('PROFILE_MAX_FILES', 200))
+
+
+def profiled(view):
+    """视图装饰器：命中采样时用 cProfile 记录本次请求"""
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _should_profile() or not _profile_lock.acquire(blocking=False):
+            return view(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 其他剖析工具（如调试器）已启用，本次不剖析
+            _profile_lock.release()
+            return view(*args, **kwargs)
+        wall_started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            response = view(*args, **kwargs)
+        finally:
+            profiler.disable()
+            _profile_lock.release()
+        wall_seconds = time.perf_counter() - wall_started
+        cpu_seconds = time.thread_time() - cpu_started
+
+        response = current_app.make_response(response)
+        try:
+            _save_profile(profiler, view.__name__, response.status_code, wall_seconds, cpu_seconds)
+        except OSError as e:
+            current_app.logger.warning("保存剖析数据失败: %s", e)
+        return response
+
+    return wrapper
+
+
+def init_app(app):
+    """注册剖析数据的管理接口"""
+
+    @app.route('/admin/profiles')
+    def list_profiles():
+        """列出已采集的剖析数据（最新的在前）"""
+        if not _is_admin():
+            abort(403)
+        directory = app.config['PROFILE_DIR']
+        if not os.path.isdir(directory):
+            return jsonify({"profiles": []})
+        profiles = []
+        for name in sorted(os.listdir(directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name), encoding='utf-8') as f:
+                    metadata = json.load(f)
+            except (OSError, ValueError):
+                continue
+            metadata.pop('input', None)
+            metadata['download'] = f"/admin/profiles/{metadata['id']}.prof"
+            profiles.append(metadata)
+        return jsonify({"profiles": profiles})
+
+    @app.route('/admin/profiles/<name>')
+    def download_profile(name):
+        """下载单个剖析文件（.prof 或 .json）"""
+        if not _is_admin():
+            abort(403)
+        if not _PROFILE_NAME.match(name):
+            abort(404)
+        return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']), name, as_attachment=True)
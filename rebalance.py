@@ -0,0 +1,84 @@
+# rebalance.py - 批量再平衡交易计算命令行工具
+#
+# 用法:
+#   python rebalance.py accounts.csv trades.csv
+#   python rebalance.py accounts.csv trades.csv --tolerance 3 --relative-tolerance none
+#
+# 输入 CSV 每行一个账户: 客户档案字段（同 batch_plan.py，可选 client_id）加上各资产类别
+# 的当前市值列（股票、债券、现金、另类投资，缺失视为 0）。目标配置由 PensionAdvisorCore 计算，
+# 交易由 advisor_core.rebalance_trades 一次性向量化求出（最小换手，回到容忍带内）。
+import argparse
+import csv
+import sys
+import time
+
+import numpy as np
+
+from advisor_core import (PensionAdvisorCore, ASSET_CLASSES, BATCH_REQUIRED_FIELDS,
+                          REBALANCE_TOLERANCE, REBALANCE_RELATIVE_TOLERANCE)
+
+OUTPUT_COLUMNS = (
+    ["row", "client_id", "total_value", "needs_rebalance", "turnover"]
+    + [f"target_{category}" for category in ASSET_CLASSES]
+    + [f"trade_{category}" for category in ASSET_CLASSES]
+)
+
+
+def read_accounts(path):
+    """读取账户 CSV，返回 (客户档案列, 持仓矩阵, client_id 列表)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        raise SystemExit(f"{path} 中没有账户")
+    missing = [field for field in BATCH_REQUIRED_FIELDS if field not in rows[0]]
+    if missing:
+        raise SystemExit(f"缺少必需字段: {', '.join(missing)}")
+
+    columns = {field: [row[field] for row in rows] for field in rows[0] if field in BATCH_REQUIRED_FIELDS
+               or field.startswith("risk_q")}
+    holdings = np.array([[float(row.get(category) or 0) for category in ASSET_CLASSES] for row in rows])
+    client_ids = [row.get("client_id", "") for row in rows]
+    return columns, holdings, client_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量计算再平衡交易")
+    parser.add_argument("input", help="账户 CSV（客户档案字段 + 各资产类别当前市值）")
+    parser.add_argument("output", help="输出的交易 CSV")
+    parser.add_argument("--tolerance", type=float, default=REBALANCE_TOLERANCE, help="绝对容忍带（百分点）")
+    parser.add_argument("--relative-tolerance", default=str(REBALANCE_RELATIVE_TOLERANCE),
+                        help="相对容忍带（目标比例的倍数），none 表示只用绝对容忍带")
+    parser.add_argument("--all", action="store_true", help="输出所有账户（默认只输出需要交易的账户）")
+    args = parser.parse_args(argv)
+    relative_tolerance = None if args.relative_tolerance.lower() == "none" else float(args.relative_tolerance)
+
+    started = time.perf_counter()
+    columns, holdings, client_ids = read_accounts(args.input)
+    try:
+        result = PensionAdvisorCore(use_ai=False).rebalance_batch(
+            columns, holdings, tolerance=args.tolerance, relative_tolerance=relative_tolerance
+        )
+    except (TypeError, ValueError) as e:
+        raise SystemExit(f"输入数据有误: {e}")
+
+    selected = np.arange(len(holdings)) if args.all else np.flatnonzero(result["needs_rebalance"])
+    total_value = holdings.sum(axis=1)
+    trades = np.round(result["trades"], 2)
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(OUTPUT_COLUMNS)
+        for i in selected.tolist():
+            writer.writerow(
+                [i + 1, client_ids[i], round(total_value[i], 2), bool(result["needs_rebalance"][i]),
+                 round(float(result["turnover"][i]), 2)]
+                + result["targets"][i].tolist() + trades[i].tolist()
+            )
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {len(holdings)} 个账户中 {int(result['needs_rebalance'].sum())} 个需要再平衡，"
+          f"总换手 {result['turnover'].sum():,.2f} 元，用时 {elapsed:.1f} 秒 -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+# report_renderer.py - 养老规划报告排版（纯文本 / Markdown / HTML）与批量导出
+#
+# 用法:
+#   python report_renderer.py clients.csv reports.zip                  # 每个客户一份 .txt 报告
+#   python report_renderer.py clients.bin reports.zip --format html    # 定长档案库输入，HTML 报告
+#
+# 各格式的模板在导入时解析成 (字面文本, 字段名, 格式说明) 片段，渲染时只做查表和拼接，
+# 报告按片段逐段产出（AI建议可以是流式生成器），不在内存中反复拼接大字符串。
+# 批量导出时逐份渲染并写入 zip 归档，内存中只有当前这一份报告；归档先写临时文件，完成后原子替换。
+import contextlib
+from datetime import datetime
+import html
+import os
+import string
+import sys
+import zipfile
+
+REPORT_FORMATS = ("text", "markdown", "html")
+REPORT_EXTENSIONS = {"text": ".txt", "markdown": ".md", "html": ".html"}
+# 命令行导出时每次从档案库取出的客户数
+EXPORT_CHUNK_ROWS = 10000
+
+_RULE = "=" * 70
+_LINE = "─" * 70
+
+_TEXT_TEMPLATES = {
+    "head": f"""
+{_RULE}
+📊 个性化养老规划综合报告
+生成时间: {{generated_at}}
+{_RULE}
+
+👤 客户档案
+{_LINE}
+   ▪ 年龄: {{age}}岁
+   ▪ 年收入: {{annual_income:,}}元
+   ▪ 现有资产: {{current_assets:,}}元
+   ▪ 月支出: {{monthly_expenses:,}}元
+   ▪ 计划退休: {{retirement_age}}岁
+   ▪ 风险偏好: {{risk_profile}}
+
+💰 养老需求分析
+{_LINE}
+   ▪ 距离退休: {{years_to_retire}}年
+   ▪ 当前年支出: {{annual_expenses:,}}元
+   ▪ 预计养老资金需求: {{total_retirement_needed:,}}元
+   ▪ 建议月储蓄额: {{monthly_savings_needed:,}}元
+
+🎯 投资配置建议
+{_LINE}
+""",
+    "allocation_row": "   ▪ {category}: {percentage}%\n",
+    "allocation_total": "   总计: {total}%\n",
+    "products_head": f"""
+📈 具体产品推荐
+{_LINE}
+""",
+    "product_category": "\n   {category} ({percentage}%):\n",
+    "product_item": "      • {product}\n",
+    "advice_head": f"""
+💡 专业建议
+{_LINE}
+   """,
+    "advice_tail": "\n",
+    "tail": f"""
+📋 行动计划
+{_LINE}
+   1. 立即开始每月储蓄 {{monthly_savings_needed:,}}元
+   2. 按照上述比例配置现有资产
+   3. 每半年回顾调整投资组合
+   4. 随着年龄增长逐步降低风险暴露
+
+📝 实施建议
+{_LINE}
+   • 建立专门的养老储蓄账户
+   • 设置每月自动转账
+   • 定期学习理财知识
+   • 保持长期投资心态
+
+⚠️ 风险提示
+{_LINE}
+   1. 本建议基于提供信息生成，仅供参考
+   2. 投资有风险，过往业绩不代表未来表现
+   3. 市场波动可能导致短期亏损
+   4. 建议咨询专业理财顾问完善规划
+
+{_RULE}
+""",
+}
+
+_MARKDOWN_TEMPLATES = {
+    "head": """# 个性化养老规划综合报告
+
+生成时间: {generated_at}
+
+## 客户档案
+
+- 年龄: {age}岁
+- 年收入: {annual_income:,}元
+- 现有资产: {current_assets:,}元
+- 月支出: {monthly_expenses:,}元
+- 计划退休: {retirement_age}岁
+- 风险偏好: {risk_profile}
+
+## 养老需求分析
+
+- 距离退休: {years_to_retire}年
+- 当前年支出: {annual_expenses:,}元
+- 预计养老资金需求: {total_retirement_needed:,}元
+- 建议月储蓄额: {monthly_savings_needed:,}元
+
+## 投资配置建议
+
+| 资产类别 | 比例 |
+| --- | ---: |
+""",
+    "allocation_row": "| {category} | {percentage}% |\n",
+    "allocation_total": "| **总计** | **{total}%** |\n",
+    "products_head": "\n## 具体产品推荐\n",
+    "product_category": "\n### {category} ({percentage}%)\n\n",
+    "product_item": "- {product}\n",
+    "advice_head": "\n## 专业建议\n\n",
+    "advice_tail": "\n",
+    "tail": """
+## 行动计划
+
+1. 立即开始每月储蓄 {monthly_savings_needed:,}元
+2. 按照上述比例配置现有资产
+3. 每半年回顾调整投资组合
+4. 随着年龄增长逐步降低风险暴露
+
+## 实施建议
+
+- 建立专门的养老储蓄账户
+- 设置每月自动转账
+- 定期学习理财知识
+- 保持长期投资心态
+
+## 风险提示
+
+1. 本建议基于提供信息生成，仅供参考
+2. 投资有风险，过往业绩不代表未来表现
+3. 市场波动可能导致短期亏损
+4. 建议咨询专业理财顾问完善规划
+""",
+}
+
+_HTML_TEMPLATES = {
+    "head": """<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+<meta charset="utf-8">
+<title>个性化养老规划综合报告</title>
+<style>
+body {{ font-family: sans-serif; max-width: 48em; margin: 2em auto; line-height: 1.6; }}
+table {{ border-collapse: collapse; }}
+td, th {{ border: 1px solid #ccc; padding: 0.2em 0.8em; }}
+td.number {{ text-align: right; }}
+.advice {{ white-space: pre-wrap; }}
+</style>
+</head>
+<body>
+<h1>个性化养老规划综合报告</h1>
+<p>生成时间: {generated_at}</p>
+<h2>客户档案</h2>
+<ul>
+<li>年龄: {age}岁</li>
+<li>年收入: {annual_income:,}元</li>
+<li>现有资产: {current_assets:,}元</li>
+<li>月支出: {monthly_expenses:,}元</li>
+<li>计划退休: {retirement_age}岁</li>
+<li>风险偏好: {risk_profile}</li>
+</ul>
+<h2>养老需求分析</h2>
+<ul>
+<li>距离退休: {years_to_retire}年</li>
+<li>当前年支出: {annual_expenses:,}元</li>
+<li>预计养老资金需求: {total_retirement_needed:,}元</li>
+<li>建议月储蓄额: {monthly_savings_needed:,}元</li>
+</ul>
+<h2>投资配置建议</h2>
+<table>
+<tr><th>资产类别</th><th>比例</th></tr>
+""",
+    "allocation_row": "<tr><td>{category}</td><td class=\"number\">{percentage}%</td></tr>\n",
+    "allocation_total": "<tr><th>总计</th><th class=\"number\">{total}%</th></tr>\n</table>\n",
+    "products_head": "<h2>具体产品推荐</h2>\n",
+    "product_category": "<h3>{category} ({percentage}%)</h3>\n",
+    "product_item": "<li>{product}</li>\n",
+    "advice_head": "<h2>专业建议</h2>\n<p class=\"advice\">",
+    "advice_tail": "</p>\n",
+    "tail": """<h2>行动计划</h2>
+<ol>
+<li>立即开始每月储蓄 {monthly_savings_needed:,}元</li>
+<li>按照上述比例配置现有资产</li>
+<li>每半年回顾调整投资组合</li>
+<li>随着年龄增长逐步降低风险暴露</li>
+</ol>
+<h2>实施建议</h2>
+<ul>
+<li>建立专门的养老储蓄账户</li>
+<li>设置每月自动转账</li>
+<li>定期学习理财知识</li>
+<li>保持长期投资心态</li>
+</ul>
+<h2>风险提示</h2>
+<ol>
+<li>本建议基于提供信息生成，仅供参考</li>
+<li>投资有风险，过往业绩不代表未来表现</li>
+<li>市场波动可能导致短期亏损</li>
+<li>建议咨询专业理财顾问完善规划</li>
+</ol>
+</body>
+</html>
+""",
+}
+
+# HTML 的产品列表需要包在 <ul> 中
+_HTML_TEMPLATES["product_category"] += "<ul>\n"
+_HTML_TEMPLATES["product_list_tail"] = "</ul>\n"
+
+_MARKDOWN_ESCAPES = str.maketrans({char: "\\" + char for char in "\\`*_[]|<>#"})
+
+
+def _escape_markdown(text):
+    return text.translate(_MARKDOWN_ESCAPES)
+
+
+def _compile(template):
+    """把 str.format 风格的模板解析成 ((字面文本, 字段名, 格式说明), ...)"""
+    return tuple((literal, field, spec or "") for literal, field, spec, _ in string.Formatter().parse(template))
+
+
+def _format_value(value, spec):
+    """按格式说明格式化；值不是数字（如“未提供”）而格式要求数字时原样显示"""
+    try:
+        return format(value, spec)
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _amount(value):
+    """用户输入的金额可能是字符串，能转换成整数时按整数显示"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+_COMPILED_TEMPLATES = {
+    "text": ({name: _compile(t) for name, t in _TEXT_TEMPLATES.items()}, str),
+    "markdown": ({name: _compile(t) for name, t in _MARKDOWN_TEMPLATES.items()}, _escape_markdown),
+    "html": ({name: _compile(t) for name, t in _HTML_TEMPLATES.items()}, html.escape),
+}
+
+
+def report_context(user_profile, retirement_data, allocation, product_recommendations,
+                   ai_advice=None, generated_at=None):
+    """整理报告用到的数据；user_profile 使用 assemble_plan 中 user_profile 的字段名（含 risk_profile）"""
+    context = {
+        "age": user_profile["age"],
+        "annual_income": _amount(user_profile.get("annual_income", "未提供")),
+        "current_assets": _amount(user_profile.get("current_assets", "未提供")),
+        "monthly_expenses": _amount(user_profile.get("monthly_expenses", "未提供")),
+        "retirement_age": user_profile.get("retirement_age", 60),
+        "risk_profile": user_profile["risk_profile"],
+        "generated_at": generated_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "allocation": [(category, percentage) for category, percentage in allocation.items() if percentage > 0],
+        "products": [
+            (category, info["percentage"], info["products"])
+            for category, info in product_recommendations.items() if info["products"]
+        ],
+        "ai_advice": ai_advice,
+    }
+    for field in ("years_to_retire", "annual_expenses", "total_retirement_needed", "monthly_savings_needed"):
+        context[field] = retirement_data[field]
+    context["total"] = sum(percentage for _, percentage in context["allocation"])
+    return context
+
+
+def plan_context(plan):
+    """由 generate_comprehensive_plan 的结果整理报告数据"""
+    return report_context(plan["user_profile"], plan["retirement_analysis"], plan["portfolio_allocation"],
+                          plan["product_recommendations"], plan.get("ai_advice"), plan.get("generated_at"))
+
+
+class ReportRenderer:
+    """按预编译模板渲染报告；同一实例可在多个线程中共用"""
+
+    def __init__(self, report_format="text"):
+        if report_format not in _COMPILED_TEMPLATES:
+            raise ValueError(f"不支持的报告格式: {report_format}")
+        self.format = report_format
+        self.extension = REPORT_EXTENSIONS[report_format]
+        self._templates, self._escape = _COMPILED_TEMPLATES[report_format]
+
+    def _fill(self, name, values):
+        escape = self._escape
+        parts = []
+        for literal, field, spec in self._templates[name]:
+            parts.append(literal)
+            if field is not None:
+                parts.append(escape(_format_value(values[field], spec)))
+        return "".join(parts)
+
+    def iter_chunks(self, context, advice=None):
+        """逐段产出报告文本
+
+        advice 为 AI 建议文本或逐段产出建议的可迭代对象（流式），缺省时使用 context["ai_advice"]；
+        两者都没有时不输出建议部分。
+        """
+        templates = self._templates
+        yield self._fill("head", context)
+        for category, percentage in context["allocation"]:
+            yield self._fill("allocation_row", {"category": category, "percentage": percentage})
+        yield self._fill("allocation_total", context)
+
+        if context["products"]:
+            yield self._fill("products_head", context)
+            for category, percentage, products in context["products"]:
+                yield self._fill("product_category", {"category": category, "percentage": percentage})
+                for product in products:
+                    yield self._fill("product_item", {"product": product})
+                if "product_list_tail" in templates:
+                    yield self._fill("product_list_tail", context)
+
+        if advice is None:
+            advice = context.get("ai_advice")
+        if advice is not None:
+            yield self._fill("advice_head", context)
+            for text in ([advice] if isinstance(advice, str) else advice):
+                yield self._escape(text)
+            yield self._fill("advice_tail", context)
+
+        yield self._fill("tail", context)
+
+    def render(self, context, advice=None):
+        """完整的报告文本"""
+        return "".join(self.iter_chunks(context, advice))
+
+
+# 归档条目名中替换为 "_" 的字符: 路径分隔符、控制字符和 Windows 文件名不允许的字符
+_UNSAFE_NAME_CHARS = str.maketrans({char: "_" for char in '/\\:*?"<>|' + "".join(map(chr, range(32)))})
+
+
+def _entry_name(name, used):
+    """把客户 ID 等外部输入变成不含路径的文件名，与已用名称（不区分大小写）重复时加序号"""
+    base = str(name).translate(_UNSAFE_NAME_CHARS).strip().lstrip(".") or "report"
+    entry, suffix = base, 1
+    while entry.casefold() in used:
+        suffix += 1
+        entry = f"{base}-{suffix}"
+    used.add(entry.casefold())
+    return entry
+
+
+def export_zip(path, reports, report_format="text", compresslevel=6):
+    """把 (文件名, 报告数据) 序列逐个渲染写入 zip 归档，返回写入的报告数
+
+    文件名不含扩展名，按报告格式自动添加；路径分隔符等字符替换为 "_"，重名时加 "-2"、"-3" 等后缀。
+    reports 可以是生成器，不会一次性载入内存。
+    """
+    renderer = ReportRenderer(report_format)
+    tmp_path = path + ".tmp"
+    count = 0
+    used = set()
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            for name, context in reports:
+                # 单份报告只有几 KB，整份压缩一次比逐段写入条目快得多
+                archive.writestr(_entry_name(name, used) + renderer.extension, renderer.render(context).encode("utf-8"))
+                count += 1
+    except BaseException:
+        # 打开临时文件本身失败时没有文件可删，保留原始异常
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+
+def _store_reports(advisor, path):
+    """定长档案库输入: 按块取出客户档案并生成规划"""
+    from client_store import ClientStore
+
+    with ClientStore(path) as store:
+        for start in range(0, len(store), EXPORT_CHUNK_ROWS):
+            book = store.book(start, start + EXPORT_CHUNK_ROWS)
+            client_ids = store.client_ids[start:start + EXPORT_CHUNK_ROWS].tolist()
+            for i, client_id in enumerate(client_ids):
+                yield str(client_id), plan_context(advisor.generate_comprehensive_plan(book.profile(i)))
+
+
+def _record_reports(advisor, records, errors):
+    """CSV/JSONL 输入: 逐行验证并生成规划，无效行记入 errors 后跳过"""
+    from advisor_core import PlanInputError, validate_plan_input
+
+    for row_number, record in enumerate(records, 1):
+        try:
+            if isinstance(record, PlanInputError):
+                raise record
+            full_user_data = validate_plan_input(record)
+        except PlanInputError as e:
+            errors.append((row_number, str(e)))
+            continue
+        name = str(record.get("client_id") or f"row-{row_number}")
+        yield name, plan_context(advisor.generate_comprehensive_plan(full_user_data))
+
+
+def main(argv=None):
+    import argparse
+    import time
+    from advisor_core import PensionAdvisorCore
+    from batch_plan import _detect_format, read_records
+
+    parser = argparse.ArgumentParser(description="批量生成养老规划报告并打包为 zip")
+    parser.add_argument("input", help="客户档案（.csv、.jsonl 或定长档案库 .bin）")
+    parser.add_argument("output", help="输出的 zip 文件")
+    parser.add_argument("--input-format", choices=["csv", "jsonl", "store"], help="输入格式，默认按扩展名判断")
+    parser.add_argument("--format", choices=REPORT_FORMATS, default="text", help="报告格式")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    advisor = PensionAdvisorCore(use_ai=False)
+    input_format = _detect_format(args.input, args.input_format)
+    errors = []
+    if input_format == "store":
+        reports = _store_reports(advisor, args.input)
+    else:
+        reports = _record_reports(advisor, read_records(args.input, input_format), errors)
+    count = export_zip(args.output, reports, args.format)
+
+    for row_number, error in errors[:20]:
+        print(f"第 {row_number} 行: {error}", file=sys.stderr)
+    if len(errors) > 20:
+        print(f"... 共 {len(errors)} 行无效", file=sys.stderr)
+    print(f"✅ 已生成 {count} 份报告，用时 {time.perf_counter() - started:.1f} 秒 -> {args.output}"
+          f"（跳过 {len(errors)} 行）", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# session_store.py - 增量规划会话的跨进程存储（SQLite）
+#
+# 会话状态（输入字段、各阶段结果、版本号）保存在同一台机器上所有 worker 进程共享的 SQLite 文件中，
+# 同一会话的请求落到任何 worker 上都能继续。多台机器部署时需要共享该文件或按会话粘滞路由。
+#
+# 会话状态以 JSON 保存（PlanSession.state() 只含 JSON 类型），不依赖代码中的类结构，升级后旧会话仍可读取。
+#
+# 并发修改采用乐观锁: 写回时要求库中版本号仍是读取时的版本，否则由调用方重新读取后再修改。
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+def _dumps(state):
+    return json.dumps(state, ensure_ascii=False, separators=(",", ":"))
+
+
+class PlanSessionStore:
+    """按会话 ID 保存 PlanSession 状态，条目超过 ttl 秒未修改后失效，最多保留 maxsize 个会话"""
+
+    def __init__(self, path="plan_sessions.sqlite3", maxsize=10000, ttl=1800):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        """当前进程的数据库连接（预加载部署时 fork 前后不能共用同一连接）"""
+        if self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plan_sessions ("
+                " id TEXT PRIMARY KEY, version INTEGER, state TEXT, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS plan_sessions_expires ON plan_sessions (expires_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, session_id):
+        """取出会话状态（PlanSession.state() 的结果），不存在或已过期时返回 None"""
+        with self._db_lock:
+            row = self._connection().execute(
+                "SELECT state FROM plan_sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except (TypeError, ValueError):
+            # 无法解析的条目（如旧版本写入的二进制数据）视为已过期
+            return None
+
+    def create(self, session_id, state):
+        """保存新会话，同时清理过期会话并把会话数控制在 maxsize 以内"""
+        now = time.time()
+        with self._db_lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM plan_sessions WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM plan_sessions WHERE id IN ("
+                " SELECT id FROM plan_sessions ORDER BY expires_at LIMIT max(0, (SELECT count(*) FROM plan_sessions) - ? + 1))",
+                (self.maxsize,),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO plan_sessions (id, version, state, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, state["version"], _dumps(state), now + self.ttl),
+            )
+
+    def replace(self, session_id, state, expected_version):
+        """库中版本仍为 expected_version 时写回会话并刷新过期时间，返回是否写入"""
+        now = time.time()
+        with self._db_lock:
+            cursor = self._connection().execute(
+                "UPDATE plan_sessions SET version = ?, state = ?, expires_at = ?"
+                " WHERE id = ? AND version = ? AND expires_at > ?",
+                (state["version"], _dumps(state), now + self.ttl,
+                 session_id, expected_version, now),
+            )
+        return cursor.rowcount == 1
+
+    def discard(self, session_id):
+        """删除会话，返回会话是否存在"""
+        with self._db_lock:
+            cursor = self._connection().execute(
+                "DELETE FROM plan_sessions WHERE id = ? AND expires_at > ?", (session_id, time.time())
+            )
+        return cursor.rowcount == 1
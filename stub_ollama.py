@@ -0,0 +1,118 @@
+# stub_ollama.py - 本地 Ollama 模拟服务（压测并发与延迟用，不需要真实模型）
+#
+#   python stub_ollama.py --port 11435 --latency 1.5 --fail-rate 0.05
+#
+# 支持 POST /api/generate（stream 为 true 时按 NDJSON 逐 token 输出）和 GET /api/tags。
+# 回复中带有 deepseek-r1 风格的 <think> 块。
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import threading
+import time
+
+STUB_RESPONSE = (
+    "<think>\n用户年龄与风险偏好匹配，需要关注储蓄率和通胀。\n</think>\n\n"
+    "1. 配置评价：该组合股债均衡，符合您的风险偏好。\n"
+    "2. 建议：坚持每月定投，每半年再平衡一次，并逐步提高债券比例。\n"
+    "3. 风险提示：市场波动可能导致短期亏损，投资需谨慎。"
+)
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": self.server.model}]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+        try:
+            if random.random() < self.server.fail_rate:
+                self._send_json(503, {"error": "stub overloaded"})
+                return
+
+            model = request.get("model", self.server.model)
+            tokens = list(STUB_RESPONSE)
+            if not request.get("stream", True):
+                time.sleep(self.server.latency)
+                self._send_json(200, {"model": model, "response": STUB_RESPONSE, "done": True})
+                return
+
+            # 流式：首 token 前等待 latency 的一部分，其余时间平摊到每个 token
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(self.server.latency * 0.2)
+            per_token = self.server.latency * 0.8 / len(tokens)
+            for token in tokens:
+                self._write_chunk({"model": model, "response": token, "done": False})
+                time.sleep(per_token)
+            self._write_chunk({"model": model, "response": "", "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def _write_chunk(self, payload):
+        data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def make_server(host="127.0.0.1", port=11435, latency=1.0, fail_rate=0.0, model="deepseek-r1:1.5b"):
+    """创建模拟服务（调用 serve_forever 启动）"""
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.model = model
+    server.lock = threading.Lock()
+    server.active = 0
+    server.peak = 0
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 Ollama 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=1.0, help="每次生成的模拟耗时（秒）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="随机返回 503 的比例")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.latency, args.fail_rate)
+    print(f"🧪 模拟 Ollama 服务运行在 http://{args.host}:{args.port} (延迟 {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"峰值并发请求数: {server.peak}")
+
+
+if __name__ == "__main__":
+    main()
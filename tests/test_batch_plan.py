@@ -0,0 +1,76 @@
+# 列式批量规划与逐个客户规划的一致性
+import numpy as np
+import pytest
+
+from advisor_core import ASSET_CLASSES, PensionAdvisorCore, validate_plan_input
+
+BASE_ROW = {"age": 30, "retirement_age": 60, "annual_income": 100000, "current_assets": 100000,
+            "monthly_expenses": 5000}
+
+
+@pytest.fixture(scope="module")
+def advisor():
+    return PensionAdvisorCore(use_ai=False)
+
+
+def _to_columns(rows):
+    """行记录转为列式输入；某行缺少的字段在该列中为 None"""
+    fields = sorted({field for row in rows for field in row})
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+
+def _assert_batch_matches(advisor, rows):
+    """列式批量结果的每一行都与 generate_comprehensive_plan 的单客户结果相同"""
+    batch = advisor.generate_batch_plan(_to_columns(rows))
+    assert batch["valid"].all()
+    for i, row in enumerate(rows):
+        plan = advisor.generate_comprehensive_plan(validate_plan_input(row))
+        assert batch["risk_profile"][i] == plan["user_profile"]["risk_profile"], row
+        for key, value in plan["retirement_analysis"].items():
+            assert batch["retirement_analysis"][key][i] == value, (row, key)
+        for category in ASSET_CLASSES:
+            assert batch["portfolio_allocation"][category][i] == plan["portfolio_allocation"][category], row
+
+
+def test_null_and_missing_risk_answers_score_as_default(advisor):
+    rows = [
+        {**BASE_ROW, "risk_q1": None, "risk_q2": None, "risk_q3": None},
+        {**BASE_ROW, "risk_q1": None, "risk_q2": "a", "risk_q3": "C"},
+        {**BASE_ROW, "risk_q2": "A"},
+        dict(BASE_ROW),
+        {**BASE_ROW, "risk_q1": "", "risk_q2": "X", "risk_q3": "b"},
+    ]
+    _assert_batch_matches(advisor, rows)
+    batch = advisor.generate_batch_plan(_to_columns(rows[:1]))
+    assert batch["risk_profile"][0] == advisor.generate_batch_plan(_to_columns(rows[3:4]))["risk_profile"][0]
+
+
+def test_random_rows_match_per_client_plans(advisor):
+    import numpy as np
+
+    rng = np.random.default_rng(20240601)
+    answers = ["A", "B", "C", "a", "c", None, ""]
+    rows = []
+    for _ in range(2000):
+        age = int(rng.integers(18, 75))
+        row = {
+            "age": age,
+            "retirement_age": age + int(rng.integers(1, 30)),
+            "annual_income": int(rng.integers(0, 2000000)),
+            "current_assets": int(rng.choice([0, 499999, 500000, 500001, int(rng.integers(0, 5000000))])),
+            "monthly_expenses": int(rng.integers(0, 50000)),
+        }
+        for question in ("risk_q1", "risk_q2", "risk_q3"):
+            if rng.random() < 0.9:
+                row[question] = answers[int(rng.integers(len(answers)))]
+        rows.append(row)
+    _assert_batch_matches(advisor, rows)
+
+
+def test_invalid_rows_are_reported_per_row(advisor):
+    rows = [dict(BASE_ROW), {**BASE_ROW, "age": "abc"}, {**BASE_ROW, "retirement_age": 30}, dict(BASE_ROW)]
+    batch = advisor.generate_batch_plan(_to_columns(rows))
+    assert batch["valid"].tolist() == [True, False, False, True]
+    assert batch["errors"] == [(1, "请输入有效的数字"), (2, "退休年龄必须大于当前年龄")]
+    assert batch["risk_profile"][1] is None and batch["risk_index"][2] == -1
+    _assert_batch_matches(advisor, [rows[0], rows[3]])